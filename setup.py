@@ -26,6 +26,9 @@ setuptools.setup(
 		'pygit2',
 		'PySide2',
 	],
+	extras_require={
+		'analytics': ['numpy'],
+	},
 	entry_points={
 		'gui_scripts': [
 			'pqgit=pqgit:run_pqgit',
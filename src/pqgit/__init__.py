@@ -1,5 +1,4 @@
-from pqgit.pqgit import pqgit_main
-
-
 def run_pqgit():
+	# imported here: the spawned worker processes import the package too, and they don't need Qt
+	from pqgit.pqgit import pqgit_main  # pylint: disable=import-outside-toplevel
 	pqgit_main()
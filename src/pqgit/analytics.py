@@ -0,0 +1,446 @@
+""" repository analytics: commit activity heatmap, activity per week, top authors
+"""
+import time
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from PySide2.QtCore import Qt, QModelIndex, QRectF, QTimer
+from PySide2.QtGui import QColor, QPainter
+from PySide2.QtWidgets import (
+	QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit, QLabel, QPushButton, QTableWidget,
+	QTableWidgetItem, QWidget, QHeaderView, QSplitter
+)
+
+from pqgit.workers import path_mask_chunk
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+RANGES = [('all', None), ('last year', 365 * DAY), ('last 90 days', 90 * DAY), ('last 30 days', 30 * DAY)]
+SCAN_CHUNK = 2000  # commits per path scan task
+
+
+@dataclass
+class Totals():
+	""" aggregates of some commits """
+	count: int
+	heatmap: np.ndarray  # commits per weekday (rows, Monday first) and hour of day, in the committers' local time
+	week_start: int
+	weeks: np.ndarray  # commits per week, from week_start on
+	per_author: np.ndarray  # commits per author index
+
+
+def _aggregate(times, local, authors):
+	""" Totals of some commits (arrays as from HistoryStats.arrays()) """
+	weekday = (local // DAY + 3) % 7  # 1970-01-01 was a Thursday
+	hour = (local % DAY) // 3600
+	heatmap = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+	if len(times):
+		week_start = int(times.min() - times.min() % WEEK)
+		weeks = np.bincount((times - week_start) // WEEK)
+	else:
+		week_start, weeks = 0, np.zeros(0, dtype=np.int64)
+	return Totals(len(times), heatmap, week_start, weeks, np.bincount(authors))
+
+
+def _merge(one, other):
+	""" Totals of the commits of both """
+	if not one.count or not other.count:
+		return other if not one.count else one
+	start = min(one.week_start, other.week_start)
+	end = max(one.week_start + len(one.weeks) * WEEK, other.week_start + len(other.weeks) * WEEK)
+	weeks = np.zeros((end - start) // WEEK, dtype=np.int64)
+	per_author = np.zeros(max(len(one.per_author), len(other.per_author)), dtype=np.int64)
+	for totals in (one, other):
+		offset = (totals.week_start - start) // WEEK
+		weeks[offset:offset + len(totals.weeks)] += totals.weeks
+		per_author[:len(totals.per_author)] += totals.per_author
+	return Totals(one.count + other.count, one.heatmap + other.heatmap, start, weeks, per_author)
+
+
+def top_authors(totals, count=20):
+	""" [(author index, commits)] of the most active authors """
+	top = np.argsort(totals.per_author)[::-1][:count]
+	return [(int(i), int(totals.per_author[i])) for i in top if totals.per_author[i]]
+
+
+class HistoryStats():
+	""" commit times, timezone offsets and authors of the loaded history, as numpy arrays """
+	def __init__(self, repo):
+		self.repo = repo
+		self.version = 0
+		self.clear()
+
+	def clear(self):
+		""" forget everything """
+		self.ids = []
+		self.author_names = []
+		self.author_index = {}  # email -> index into author_names
+		self._chunks = []  # (times, offsets, authors) arrays, one per add()
+		self._arrays = None  # concatenated chunks
+		self._path_masks = {}  # path -> (mask, known): bool arrays over ids, filled in by path scans
+		self._totals = {}  # (span, author) -> Totals, kept up to date by add()
+		self.now = time.time()  # the time spans count back from
+		self.version += 1  # results of path scans started before a clear() don't apply
+
+	def __len__(self):
+		return len(self.ids)
+
+	def add(self, commits):
+		""" append newly loaded commits (the 'working' row is skipped) """
+		commits = [c for c in commits if c.dt is not None]
+		if not commits:
+			return
+
+		authors = np.empty(len(commits), dtype=np.int32)
+		for i, c in enumerate(commits):
+			email = c.author.email.lower()
+			idx = self.author_index.get(email)
+			if idx is None:
+				idx = self.author_index[email] = len(self.author_names)
+				self.author_names.append(c.author.name)
+			authors[i] = idx
+
+		times = np.fromiter((c.dt for c in commits), dtype=np.int64, count=len(commits))
+		offsets = np.fromiter((c.dt_offs for c in commits), dtype=np.int16, count=len(commits))
+		self.ids += [c.id for c in commits]
+		self._chunks.append((times, offsets, authors))
+		self._arrays = None
+
+		# only the new commits are counted into the totals shown so far
+		local = times + offsets.astype(np.int64) * 60
+		for (span, author), totals in self._totals.items():
+			mask = self._filter(times, authors, span, author)
+			self._totals[span, author] = _merge(totals, _aggregate(times[mask], local[mask], authors[mask]))
+
+	def arrays(self):
+		""" (times, local times, authors) of all commits """
+		if self._arrays is None:
+			if self._chunks:
+				times = np.concatenate([c[0] for c in self._chunks])
+				offsets = np.concatenate([c[1] for c in self._chunks])
+				authors = np.concatenate([c[2] for c in self._chunks])
+			else:
+				times = np.empty(0, dtype=np.int64)
+				offsets = np.empty(0, dtype=np.int16)
+				authors = np.empty(0, dtype=np.int32)
+			self._chunks = [(times, offsets, authors)]
+			self._arrays = (times, times + offsets.astype(np.int64) * 60, authors)
+		return self._arrays
+
+	def _path_arrays(self, path):
+		""" (mask, known) for path, grown to cover all ids """
+		mask, known = self._path_masks.get(path, (np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)))
+		if len(mask) < len(self.ids):
+			grow = np.zeros(len(self.ids) - len(mask), dtype=bool)
+			mask, known = np.concatenate([mask, grow]), np.concatenate([known, grow])
+			self._path_masks[path] = (mask, known)
+		return mask, known
+
+	def path_mask(self, path):
+		""" which commits touched something under path; None while some of them are not scanned yet """
+		mask, known = self._path_arrays(path)
+		return mask if known.all() else None
+
+	def path_todo(self, path):
+		""" indices of the commits not scanned for path yet """
+		return np.flatnonzero(~self._path_arrays(path)[1])
+
+	def set_path_mask(self, path, indices, values):
+		""" scan results for some commits (indices into ids) """
+		mask, known = self._path_arrays(path)
+		mask[indices] = values
+		known[indices] = True
+
+	def _filter(self, times, authors, span, author):
+		""" mask of the commits in the last span seconds, by some author (index) """
+		mask = np.ones(len(times), dtype=bool)
+		if span is not None:
+			mask &= times >= self.now - span
+		if author is not None:
+			mask &= authors == author
+		return mask
+
+	def totals(self, span=None, author=None, path_mask=None):
+		"""
+		Totals of the commits in the last span seconds, by some author (index), in path_mask (see path_mask());
+		without a path_mask they are remembered, so more loaded commits only need counting themselves
+		"""
+		key = (span, author)
+		if path_mask is None and key in self._totals:
+			return self._totals[key]
+
+		times, local, authors = self.arrays()
+		mask = self._filter(times, authors, span, author)
+		if path_mask is not None:
+			return _aggregate(times[mask & path_mask], local[mask & path_mask], authors[mask & path_mask])
+		self._totals[key] = _aggregate(times[mask], local[mask], authors[mask])
+		return self._totals[key]
+
+
+class HeatmapWidget(QWidget):
+	""" weekday x hour grid, darker for more commits """
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		self.counts = np.zeros((7, 24), dtype=np.int64)
+		self.setMinimumSize(400, 140)
+
+	def set_counts(self, counts):
+		""" show new counts """
+		self.counts = counts
+		self.update()
+
+	def paintEvent(self, event):
+		""" draw the grid """
+		del event
+		painter = QPainter(self)
+		label_w, label_h = 40, 16
+		cell_w = (self.width() - label_w) / 24
+		cell_h = (self.height() - label_h) / 7
+		top = max(int(self.counts.max()), 1)
+
+		for hour in range(0, 24, 3):
+			painter.drawText(QRectF(label_w + hour * cell_w, 0, cell_w * 3, label_h), Qt.AlignLeft, str(hour))
+		for day in range(7):
+			y = label_h + day * cell_h
+			painter.drawText(QRectF(0, y, label_w, cell_h), Qt.AlignVCenter, WEEKDAYS[day])
+			for hour in range(24):
+				value = int(self.counts[day, hour])
+				color = QColor(13, 170, 13) if value else QColor(Qt.lightGray)
+				color.setAlphaF(0.15 + 0.85 * value / top if value else 0.3)
+				painter.fillRect(QRectF(label_w + hour * cell_w + 1, y + 1, cell_w - 2, cell_h - 2), color)
+		painter.end()
+
+
+class WeeksWidget(QWidget):
+	""" bar chart, one bar per week """
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		self.start = 0
+		self.counts = np.zeros(0, dtype=np.int64)
+		self.setMinimumSize(400, 100)
+
+	def set_counts(self, start, counts):
+		""" show new counts """
+		self.start, self.counts = start, counts
+		self.update()
+
+	def paintEvent(self, event):
+		""" draw the bars """
+		del event
+		painter = QPainter(self)
+		label_h = 16
+		if len(self.counts):
+			bar_w = self.width() / len(self.counts)
+			top = max(int(self.counts.max()), 1)
+			height = self.height() - label_h
+			for week, value in enumerate(self.counts):
+				bar_h = height * int(value) / top
+				painter.fillRect(QRectF(week * bar_w, height - bar_h, max(bar_w - 1, 1), bar_h), QColor(13, 170, 13))
+			first = time.strftime('%Y-%m-%d', time.gmtime(self.start))
+			last = time.strftime('%Y-%m-%d', time.gmtime(self.start + WEEK * (len(self.counts) - 1)))
+			painter.drawText(QRectF(0, height, self.width(), label_h), Qt.AlignLeft, first)
+			painter.drawText(QRectF(0, height, self.width(), label_h), Qt.AlignRight, last)
+		painter.end()
+
+
+class AnalyticsDialog(QDialog):
+	"""
+	activity of the history loaded in a HistoryModel; follows the model as rows get loaded,
+	so only new commits are added to the arrays. Which commits touch the path filter is found by
+	worker processes, once per path and commit.
+	"""
+	def __init__(self, parent, repo, history_model, get_executor):
+		super().__init__(parent)
+		self.setWindowTitle('Analytics')
+		self.resize(900, 600)
+		self.repo = repo
+		self.history_model = history_model
+		self.get_executor = get_executor
+		self.stats = HistoryStats(repo)
+		self.stats_dirty = True  # rows went away; rebuild from the model
+
+		self.scan = None  # path scan running: (path, stats version, [(indices, future)], total)
+		self.scan_timer = QTimer(self)
+		self.scan_timer.setInterval(100)
+		self.scan_timer.timeout.connect(self.poll_scan)
+		self.refresh_timer = QTimer(self)  # once after a burst of inserted or removed rows
+		self.refresh_timer.setSingleShot(True)
+		self.refresh_timer.setInterval(0)
+		self.refresh_timer.timeout.connect(self.refresh)
+
+		self.cbRange = QComboBox(self)
+		self.cbRange.addItems([r[0] for r in RANGES])
+		self.cbAuthor = QComboBox(self)
+		self.lePath = QLineEdit(self)
+		self.lePath.setPlaceholderText('path (file or directory)')
+		self.lePath.setClearButtonEnabled(True)
+		self.pbLoadAll = QPushButton('load all', self)
+		self.lbCount = QLabel(self)
+
+		filters = QHBoxLayout()
+		for widget in (self.cbRange, self.cbAuthor, self.lePath, self.pbLoadAll, self.lbCount):
+			filters.addWidget(widget)
+
+		self.heatmap = HeatmapWidget(self)
+		self.weeks = WeeksWidget(self)
+		self.twAuthors = QTableWidget(0, 2, self)
+		self.twAuthors.setHorizontalHeaderLabels(['author', 'commits'])
+		self.twAuthors.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+		self.twAuthors.verticalHeader().hide()
+
+		charts = QSplitter(Qt.Vertical, self)
+		charts.addWidget(self.heatmap)
+		charts.addWidget(self.weeks)
+		splitter = QSplitter(Qt.Horizontal, self)
+		splitter.addWidget(charts)
+		splitter.addWidget(self.twAuthors)
+		splitter.setSizes([600, 300])
+
+		layout = QVBoxLayout(self)
+		layout.addLayout(filters)
+		layout.addWidget(splitter)
+
+		self.cbRange.currentIndexChanged.connect(self.redraw)
+		self.cbAuthor.currentIndexChanged.connect(self.redraw)
+		self.lePath.editingFinished.connect(self.redraw)
+		self.pbLoadAll.clicked.connect(self.load_all)
+
+		history_model.rowsInserted.connect(self.on_rows_inserted)
+		history_model.rowsAboutToBeRemoved.connect(self.on_rows_removed)
+		history_model.rowsRemoved.connect(self.on_rows_gone)
+		history_model.modelReset.connect(self.on_reset)
+
+		self.refresh()
+
+	def on_rows_inserted(self, parent, first, last):
+		""" newly loaded commits """
+		del parent
+		if not self.stats_dirty:
+			self.stats.add(self.history_model.commits[first:last + 1])
+		self.refresh_timer.start()  # once for a burst of fetched batches
+
+	def on_rows_removed(self, parent, first, last):
+		""" only the 'working' row can go away without a rebuild """
+		del parent
+		if any(c.dt is not None for c in self.history_model.commits[first:last + 1]):
+			self.stats_dirty = True
+
+	def on_rows_gone(self, parent, first, last):
+		""" rebuild once a burst of removals is over (a method, so the connection goes away with the dialog) """
+		del parent, first, last
+		self.refresh_timer.start()
+
+	def on_reset(self):
+		""" everything changed """
+		self.stats_dirty = True
+		self.refresh()
+
+	def load_all(self):
+		""" read the rest of the history into the model """
+		while self.history_model.canFetchMore(QModelIndex()):
+			self.history_model.fetchMore(QModelIndex())
+
+	def refresh(self):
+		""" bring stats up to date, then redraw """
+		if self.stats_dirty:
+			self.stats.clear()
+			self.stats.add(self.history_model.commits)
+			self.stats_dirty = False
+
+		self.pbLoadAll.setEnabled(self.history_model.canFetchMore(QModelIndex()))
+
+		# author list: most active first
+		current = self.cbAuthor.currentData()
+		self.cbAuthor.blockSignals(True)
+		self.cbAuthor.clear()
+		self.cbAuthor.addItem('all authors', None)
+		for author, _count in top_authors(self.stats.totals(), 50):
+			self.cbAuthor.addItem(self.stats.author_names[author], author)
+		idx = self.cbAuthor.findData(current)
+		self.cbAuthor.setCurrentIndex(max(idx, 0))
+		self.cbAuthor.blockSignals(False)
+
+		self.redraw()
+
+	def redraw(self):
+		""" aggregate for the current filters """
+		path = self.lePath.text().strip().strip('/')
+		path_mask = None
+		if path:
+			path_mask = self.stats.path_mask(path)
+			if path_mask is None:
+				self.scan_paths(path)  # redraws when done
+				return
+
+		totals = self.stats.totals(
+			span=RANGES[self.cbRange.currentIndex()][1],
+			author=self.cbAuthor.currentData(),
+			path_mask=path_mask,
+		)
+		self.lbCount.setText(f'{totals.count} of {len(self.stats)} loaded commits')
+		self.heatmap.set_counts(totals.heatmap)
+		self.weeks.set_counts(totals.week_start, totals.weeks)
+
+		authors = top_authors(totals)
+		self.twAuthors.setRowCount(len(authors))
+		for row, (author, count) in enumerate(authors):
+			self.twAuthors.setItem(row, 0, QTableWidgetItem(self.stats.author_names[author]))
+			self.twAuthors.setItem(row, 1, QTableWidgetItem(str(count)))
+
+	def scan_paths(self, path):
+		""" find the commits touching path, in the worker processes """
+		if self.scan is not None and self.scan[:2] == (path, self.stats.version):
+			return
+		self.cancel_scan()
+
+		todo = self.stats.path_todo(path)
+		executor = self.get_executor()
+		futures = []
+		for start in range(0, len(todo), SCAN_CHUNK):
+			indices = todo[start:start + SCAN_CHUNK]
+			ids = [self.stats.ids[i] for i in indices]
+			futures.append((indices, executor.submit(path_mask_chunk, self.repo.path, path, ids)))
+		self.scan = (path, self.stats.version, futures, len(todo))
+		self.scan_timer.start()
+		self.poll_scan()
+
+	def poll_scan(self):
+		""" collect path scan results; redraw when all are in """
+		path, version, futures, total = self.scan
+		pending = []
+		for indices, future in futures:
+			if not future.done():
+				pending.append((indices, future))
+				continue
+			try:
+				values = future.result()
+			except Exception as ex:  #pylint: disable=broad-except
+				self.cancel_scan()
+				self.lbCount.setText(f'path scan failed: {type(ex).__name__}: {ex}')
+				return
+			if version == self.stats.version:
+				self.stats.set_path_mask(path, indices, values)
+
+		if pending:
+			self.scan = (path, version, pending, total)
+			done = total - sum(len(indices) for indices, _future in pending)
+			self.lbCount.setText(f'scanning paths: {done * 100 // max(total, 1)}%')
+		else:
+			self.cancel_scan()
+			self.redraw()
+
+	def cancel_scan(self):
+		""" drop the running path scan """
+		self.scan_timer.stop()
+		if self.scan is not None:
+			for _indices, future in self.scan[2]:
+				future.cancel()
+		self.scan = None
+
+	def closeEvent(self, event):  # pylint: disable=invalid-name
+		""" stop scanning when closed """
+		self.cancel_scan()
+		super().closeEvent(event)
@@ -0,0 +1,229 @@
+""" reader for git's commit-graph file(s)
+
+see https://git-scm.com/docs/commit-graph-format
+"""
+import os
+import mmap
+import heapq
+import struct
+from bisect import bisect_right
+
+HASH_LEN = 20  # sha1 only
+PARENT_NONE = 0x70000000
+PARENT_EXTRA = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+CDAT_LEN = HASH_LEN + 16
+
+
+class _Layer():
+	""" one memory-mapped commit-graph file """
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		sig, version, hash_version, n_chunks = struct.unpack_from('>4sBBB', self.mm, 0)
+		if sig != b'CGPH' or version != 1 or hash_version != 1:
+			raise ValueError(f'unsupported commit-graph: {path}')
+
+		self.chunks = {}
+		for i in range(n_chunks):
+			chunk_id, offset = struct.unpack_from('>4sQ', self.mm, 8 + i * 12)
+			self.chunks[chunk_id] = offset
+		for chunk_id in (b'OIDF', b'OIDL', b'CDAT'):
+			if chunk_id not in self.chunks:
+				raise ValueError(f'commit-graph without {chunk_id}: {path}')
+
+		self.fanout = struct.unpack_from('>256L', self.mm, self.chunks[b'OIDF'])
+		self.count = self.fanout[255]
+		self.start = 0  # global position of first commit; set by CommitGraph for chains
+
+	def oid(self, idx):
+		""" binary oid at local index """
+		off = self.chunks[b'OIDL'] + idx * HASH_LEN
+		return self.mm[off:off + HASH_LEN]
+
+	def find(self, oid):
+		""" local index of binary oid, or None """
+		lo = self.fanout[oid[0] - 1] if oid[0] else 0
+		hi = self.fanout[oid[0]]
+		while lo < hi:
+			mid = (lo + hi) // 2
+			other = self.oid(mid)
+			if other < oid:
+				lo = mid + 1
+			elif other > oid:
+				hi = mid
+			else:
+				return mid
+		return None
+
+	def cdat(self, idx):
+		""" (parent1, parent2, generation, commit time) at local index """
+		p1, p2, hi, lo = struct.unpack_from('>LLLL', self.mm, self.chunks[b'CDAT'] + idx * CDAT_LEN + HASH_LEN)
+		return p1, p2, hi >> 2, ((hi & 3) << 32) | lo
+
+	def edge(self, idx):
+		""" entry of the extra edges list (octopus merges) """
+		return struct.unpack_from('>L', self.mm, self.chunks[b'EDGE'] + idx * 4)[0]
+
+	def close(self):
+		""" unmap """
+		self.mm.close()
+
+
+class CommitGraph():
+	"""
+	parents, commit times and generation numbers of commits, straight from the commit-graph file(s),
+	without reading commit objects. Commits are addressed by their position in the graph.
+	"""
+	def __init__(self, layers):
+		self.layers = layers
+		self.starts = []
+		start = 0
+		for layer in layers:
+			layer.start = start
+			self.starts.append(start)
+			start += layer.count
+		self.count = start
+
+	@classmethod
+	def open(cls, git_dir):
+		""" CommitGraph for a repo's .git dir, None if there is none (or it can't be read) """
+		info = os.path.join(git_dir, 'objects', 'info')
+		single = os.path.join(info, 'commit-graph')
+		chain = os.path.join(info, 'commit-graphs', 'commit-graph-chain')
+
+		layers = []
+		try:
+			if os.path.exists(chain):
+				with open(chain) as f:
+					hashes = [line.strip() for line in f if line.strip()]
+				for h in hashes:
+					layers.append(_Layer(os.path.join(info, 'commit-graphs', f'graph-{h}.graph')))
+			elif os.path.exists(single):
+				layers.append(_Layer(single))
+		except (OSError, ValueError, struct.error):
+			for layer in layers:
+				layer.close()
+			return None
+
+		if not layers:
+			return None
+		return cls(layers)
+
+	def close(self):
+		""" unmap all files """
+		for layer in self.layers:
+			layer.close()
+		self.layers = []
+
+	def _layer(self, pos):
+		""" layer holding a global position, and the local index in it """
+		layer = self.layers[bisect_right(self.starts, pos) - 1]
+		return layer, pos - layer.start
+
+	def find(self, oid_hex):
+		""" position of a commit (hex id), None if it's not in the graph """
+		oid = bytes.fromhex(oid_hex)
+		for layer in self.layers:
+			idx = layer.find(oid)
+			if idx is not None:
+				return layer.start + idx
+		return None
+
+	def oid_hex(self, pos):
+		""" hex id of the commit at pos """
+		layer, idx = self._layer(pos)
+		return layer.oid(idx).hex()
+
+	def parents(self, pos):
+		""" positions of the parents of pos """
+		layer, idx = self._layer(pos)
+		p1, p2, _gen, _time = layer.cdat(idx)
+		ret = []
+		if p1 != PARENT_NONE:
+			ret.append(p1)
+		if p2 == PARENT_NONE:
+			return ret
+		if not p2 & PARENT_EXTRA:
+			ret.append(p2)
+			return ret
+		edge = p2 & ~PARENT_EXTRA
+		while True:
+			value = layer.edge(edge)
+			ret.append(value & ~GRAPH_LAST_EDGE)
+			if value & GRAPH_LAST_EDGE:
+				return ret
+			edge += 1
+
+	def generation(self, pos):
+		""" topological level (0 if the file was written without generation numbers) """
+		layer, idx = self._layer(pos)
+		return layer.cdat(idx)[2]
+
+	def commit_time(self, pos):
+		""" commit time, seconds since epoch """
+		layer, idx = self._layer(pos)
+		return layer.cdat(idx)[3]
+
+	def has_generations(self):
+		""" whether generation numbers can be used for cut-offs """
+		return all(layer.count == 0 or layer.cdat(0)[2] > 0 for layer in self.layers)
+
+	def is_ancestor(self, anc, desc):
+		""" whether commit anc (position) is reachable from commit desc (position) """
+		if anc == desc:
+			return True
+		# without generation numbers there is no cut-off, everything reachable gets walked
+		min_gen = self.generation(anc) if self.has_generations() else -1
+		seen = {desc}
+		stack = [desc]
+		while stack:
+			pos = stack.pop()
+			for parent in self.parents(pos):
+				if parent == anc:
+					return True
+				if parent not in seen and self.generation(parent) > min_gen:
+					seen.add(parent)
+					stack.append(parent)
+		return False
+
+	def topo_order(self, tips):
+		"""
+		generator over positions reachable from tips (positions), children before parents;
+		among the commits that can be shown next, the newest one comes first.
+		Only walks as much of the graph as needed for the commits asked for so far.
+		"""
+		# indegree walk: count children, highest generation first; a commit's count is final
+		# once everything above its generation has been walked
+		indegree = {}
+		explore = []
+		for tip in tips:
+			if tip not in indegree:
+				indegree[tip] = 1
+				heapq.heappush(explore, (-self.generation(tip), tip))
+
+		def walk_down_to(gen):
+			while explore and -explore[0][0] > gen:
+				_g, pos = heapq.heappop(explore)
+				for parent in self.parents(pos):
+					if parent in indegree:
+						indegree[parent] += 1
+					else:
+						indegree[parent] = 2
+						heapq.heappush(explore, (-self.generation(parent), parent))
+
+		ready = []
+		for tip in set(tips):
+			walk_down_to(self.generation(tip))
+			if indegree[tip] == 1:
+				heapq.heappush(ready, (-self.commit_time(tip), tip))
+
+		while ready:
+			_t, pos = heapq.heappop(ready)
+			yield pos
+			for parent in self.parents(pos):
+				walk_down_to(self.generation(parent))
+				indegree[parent] -= 1
+				if indegree[parent] == 1:
+					heapq.heappush(ready, (-self.commit_time(parent), parent))
@@ -2,12 +2,20 @@
 """
 
 # from typing import List
+import time
+import itertools
+from bisect import bisect_left
+from operator import attrgetter
 from datetime import datetime
 from dataclasses import dataclass
 from PySide2 import QtCore, QtGui
 from PySide2.QtCore import Qt
+
+from pqgit.util import tree_changes
 # from collections import namedtuple
 
+FETCH_BATCH = 1000  # rows read at once for lazily filled models
+
 
 @dataclass
 class Branch():
@@ -35,17 +43,107 @@ class Patch():
 	status: str
 	new_file_id: str
 	old_file_id: str
+	old_path: str = None  # renamed or copied from
+	similarity: int = None  # percent, for renames and copies
+	gitlink: bool = False  # submodule; the ids are commits of another repo
 
 
-class BranchesModel(QtCore.QAbstractTableModel):
-	""" branches """
-	def __init__(self):
-		super(BranchesModel, self).__init__()
-		self.branches = []
+class KeyedTableModel(QtCore.QAbstractTableModel):
+	""" rows with a unique key each (given by the key function); updates only signal the rows that actually differ """
+	def __init__(self, key):
+		super(KeyedTableModel, self).__init__()
+		self.key = key
+		self.items = []
+		self._rows = None  # key -> row, rebuilt on demand after rows moved
 
 	def rowCount(self, parent=QtCore.QModelIndex()):
 		del parent
-		return len(self.branches)
+		return len(self.items)
+
+	def row_of(self, key):
+		""" row for some key, None if not there """
+		if self._rows is None:
+			self._rows = {self.key(item): row for row, item in enumerate(self.items)}
+		return self._rows.get(key)
+
+	def insert_rows(self, row, items):
+		""" insert items before row """
+		if not items:
+			return
+		self.beginInsertRows(QtCore.QModelIndex(), row, row + len(items) - 1)
+		if self._rows is not None and row == len(self.items):
+			# appended (e.g. fetchMore), existing rows stay where they are
+			self._rows.update((self.key(item), row + i) for i, item in enumerate(items))
+		else:
+			self._rows = None
+		self.items[row:row] = items
+		self.endInsertRows()
+
+	def remove_rows(self, row, count):
+		""" remove count rows starting with row """
+		if count < 1:
+			return
+		self.beginRemoveRows(QtCore.QModelIndex(), row, row + count - 1)
+		del self.items[row:row + count]
+		self._rows = None
+		self.endRemoveRows()
+
+	def set_row(self, row, item):
+		""" replace the item in some row (same key) """
+		self.items[row] = item
+		self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+	def update(self, items):
+		""" show items, keeping view state (selection, scroll) for the rows that stay """
+		new_keys = [self.key(item) for item in items]
+		new_set = set(new_keys)
+
+		# removed rows, bottom-up in contiguous blocks
+		row = len(self.items) - 1
+		while row >= 0:
+			end = row
+			while row >= 0 and self.key(self.items[row]) not in new_set:
+				row -= 1
+			if row < end:
+				self.remove_rows(row + 1, end - row)
+			else:
+				row -= 1
+
+		kept = [self.key(item) for item in self.items]
+		kept_set = set(kept)
+		if kept != [k for k in new_keys if k in kept_set]:
+			# moved around (e.g. rebase); nothing sensible to keep
+			self.beginResetModel()
+			self.items[:] = items
+			self._rows = None
+			self.endResetModel()
+			return
+
+		# inserted and changed rows, top-down
+		row, i = 0, 0
+		while i < len(items):
+			if row < len(self.items) and self.key(self.items[row]) == new_keys[i]:
+				if self.items[row] != items[i]:
+					self.set_row(row, items[i])
+				row += 1
+				i += 1
+				continue
+			start = i
+			while i < len(items) and new_keys[i] not in kept_set:
+				i += 1
+			self.insert_rows(row, items[start:i])
+			row += i - start
+
+
+class BranchesModel(KeyedTableModel):
+	""" branches """
+	def __init__(self):
+		super(BranchesModel, self).__init__(attrgetter('ref'))
+
+	@property
+	def branches(self):
+		""" all branches and tags, as shown """
+		return self.items
 
 	def columnCount(self, parent=QtCore.QModelIndex()):
 		del parent
@@ -78,37 +176,38 @@ class BranchesModel(QtCore.QAbstractTableModel):
 			return ['', 'name'][section]
 		return None
 
-	def update(self, branches):
-		""" update """
-		self.beginResetModel()
 
-		self.branches = branches
+class HistoryModel(KeyedTableModel):
+	""" commits	"""
+	def __init__(self):
+		super(HistoryModel, self).__init__(attrgetter('id'))
+		self.pending = None  # iterator over the commits not read yet
 
-		self.endResetModel()
+	@property
+	def commits(self):
+		""" all commits read so far, as shown """
+		return self.items
 
+	def update(self, items, pending=None):  # pylint: disable=arguments-differ
+		""" show items; commits from pending are added as the view asks for them """
+		self.pending = pending
+		super(HistoryModel, self).update(items)
 
-class HistoryModel(QtCore.QAbstractTableModel):
-	""" commits	"""
-	def __init__(self):
-		super(HistoryModel, self).__init__()
-		self.commits = []
+	def canFetchMore(self, parent=QtCore.QModelIndex()):
+		del parent
+		return self.pending is not None
 
-	def rowCount(self, parent=QtCore.QModelIndex()):
+	def fetchMore(self, parent=QtCore.QModelIndex()):
 		del parent
-		return len(self.commits)
+		batch = list(itertools.islice(self.pending, FETCH_BATCH))
+		if len(batch) < FETCH_BATCH:
+			self.pending = None
+		self.insert_rows(len(self.items), batch)
 
 	def columnCount(self, parent=QtCore.QModelIndex()):
 		del parent
 		return 4
 
-	def update(self, commits):
-		""" update """
-		self.beginResetModel()
-
-		self.commits = commits
-
-		self.endResetModel()
-
 	def data(self, index, role):
 		row = index.row()
 		col = index.column()
@@ -144,27 +243,49 @@ class HistoryModel(QtCore.QAbstractTableModel):
 		return None
 
 
-class FilesModel(QtCore.QAbstractTableModel):
+class _KeyView():
+	""" sequence of the keys of a model's items (for bisect) """
+	def __init__(self, model):
+		self.model = model
+
+	def __len__(self):
+		return len(self.model.items)
+
+	def __getitem__(self, row):
+		return self.model.key(self.model.items[row])
+
+
+class FilesModel(KeyedTableModel):
 	""" files """
 	def __init__(self):
-		super(FilesModel, self).__init__()
-		self.patches = []
+		super(FilesModel, self).__init__(attrgetter('path'))
 
-	def rowCount(self, parent):
-		del parent
-		return len(self.patches)
+	@property
+	def patches(self):
+		""" all patches, as shown """
+		return self.items
 
 	def columnCount(self, parent=QtCore.QModelIndex()):
 		del parent
-		return 2
-
-	def update(self, patches):
-		""" update """
-		self.beginResetModel()
-
-		self.patches = patches
-
-		self.endResetModel()
+		return 3
+
+	def set_patch(self, patch):
+		""" insert or replace one patch, keeping the list sorted by path """
+		row = self.row_of(patch.path)
+		if row is not None:
+			self.set_row(row, patch)
+			return
+		self.insert_rows(bisect_left(_KeyView(self), patch.path), [patch])
+
+	def remove_path(self, path):
+		""" remove the patch for some path, if shown """
+		row = self.row_of(path)
+		if row is not None:
+			self.remove_rows(row, 1)
+
+	def patch_at(self, index):
+		""" Patch shown at index """
+		return self.patches[index.row()]
 
 	def data(self, index, role):
 		row = index.row()
@@ -175,6 +296,8 @@ class FilesModel(QtCore.QAbstractTableModel):
 				ret = self.patches[row].status
 			if col == 1:
 				ret = self.patches[row].path
+			if col == 2 and self.patches[row].old_path:
+				ret = f'{self.patches[row].old_path} ({self.patches[row].similarity}%)'
 		elif role == Qt.ForegroundRole:
 			if self.patches[row].status == 'D':
 				ret = QtGui.QColor(Qt.red)
@@ -182,11 +305,246 @@ class FilesModel(QtCore.QAbstractTableModel):
 				ret = QtGui.QColor(Qt.green)
 			elif self.patches[row].status == 'I':
 				ret = QtGui.QColor(Qt.gray)
+			elif self.patches[row].status in 'RC':
+				ret = QtGui.QColor(Qt.blue)
+
+		return ret
+
+	def headerData(self, section, orientation, role):
+		if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+			return ['', 'file', 'renamed'][section]
+		return None
+
+
+class _FileNode():
+	""" one row of FilesTreeModel, a directory or a file """
+	def __init__(self, parent, name, status, old_id, new_id, type_str):
+		self.parent = parent
+		self.name = name
+		self.path = f'{parent.path}/{name}' if parent is not None and parent.path else name
+		self.status = status
+		self.old_id = old_id
+		self.new_id = new_id
+		self.is_dir = type_str == 'tree'
+		self.gitlink = type_str == 'commit'
+		self.row = 0
+		self.entries = None  # all changed entries, diffed when expanded
+		self.children = None  # the entries passing the path filter, as shown
+		self.counts = None  # status -> number of files below, counted in the background
+
+
+class FilesTreeModel(QtCore.QAbstractItemModel):
+	"""
+	files of a (big) diff as a tree; a directory's entries are diffed only when it's expanded.
+	The number of changed files below the shown directories is counted a bit at a time, in timer slices.
+	"""
+	def __init__(self, repo, old_tree_id, new_tree_id):
+		super(FilesTreeModel, self).__init__()
+		self.repo = repo
+		self.prefix = ''
+		self.node_count = 0  # nodes diffed so far
+		self.root = _FileNode(None, '', 'M', old_tree_id, new_tree_id, 'tree')
+		self.root.entries = self._diff_dir(self.root)
+		self.root.children = list(self.root.entries)
+		self._number(self.root.children)
+
+		self._count_cache = {}  # (old tree id, new tree id) -> {status: files}
+		self._count_queue = []  # directories to count
+		self._counting = self._count_dirs()
+		self._count_timer = QtCore.QTimer(self)
+		self._count_timer.setInterval(0)
+		self._count_timer.timeout.connect(self._count_step)
+		self._queue_counts(self.root.children)
+
+	def set_prefix(self, prefix):
+		""" only show paths starting with prefix (and the directories leading there); loaded rows are kept """
+		prefix = prefix.strip().strip('/')
+		if prefix != self.prefix:
+			self.prefix = prefix
+			self._refilter(self.root, QtCore.QModelIndex())
+
+	def _shown(self, node):
+		""" whether node passes the prefix filter """
+		if not self.prefix or node.path.startswith(self.prefix):
+			return True
+		return node.is_dir and self.prefix.startswith(node.path + '/')
+
+	@staticmethod
+	def _number(children):
+		for row, child in enumerate(children):
+			child.row = row
+
+	def _refilter(self, node, parent):
+		""" apply the filter to the loaded entries of node and below, signalling only rows that come and go """
+		shown = [c for c in node.entries if self._shown(c)]
+		keep = {id(c) for c in shown}
+
+		# removals, bottom-up in runs of adjacent rows
+		row = len(node.children) - 1
+		while row >= 0:
+			if id(node.children[row]) in keep:
+				row -= 1
+				continue
+			last = row
+			while row >= 0 and id(node.children[row]) not in keep:
+				row -= 1
+			self.beginRemoveRows(parent, row + 1, last)
+			del node.children[row + 1:last + 1]
+			self._number(node.children)
+			self.endRemoveRows()
+
+		# insertions, in runs; children are in the order of entries, same as shown
+		row = 0
+		while row < len(shown):
+			if row < len(node.children) and node.children[row] is shown[row]:
+				row += 1
+				continue
+			first = row
+			present = node.children[row] if row < len(node.children) else None
+			while row < len(shown) and shown[row] is not present:
+				row += 1
+			self.beginInsertRows(parent, first, row - 1)
+			node.children[first:first] = shown[first:row]
+			self._number(node.children)
+			self.endInsertRows()
+		self._queue_counts(shown)
+
+		for child in node.children:
+			if child.entries is not None:
+				self._refilter(child, self.createIndex(child.row, 0, child))
+
+	def _diff_dir(self, node):
+		""" changed entries of one directory, compared by id; unchanged subtrees are never opened """
+		entries = [
+			_FileNode(node, name, status, old_id, new_id, type_str)
+			for name, status, old_id, new_id, type_str in tree_changes(self.repo, node.old_id, node.new_id)
+		]
+		entries.sort(key=lambda c: (not c.is_dir, c.name))
+		self.node_count += len(entries)
+		return entries
+
+	def _queue_counts(self, nodes):
+		""" count the files below these (shown) directories, in the background """
+		self._count_queue += [n for n in nodes if n.is_dir and n.counts is None]
+		if self._count_queue:
+			self._count_timer.start()
+
+	def _count_step(self):
+		""" count for a few ms """
+		start = time.monotonic()
+		for _ in self._counting:
+			if time.monotonic() - start > 0.02:
+				return
+		self._count_timer.stop()
+		self._counting = self._count_dirs()
+
+	def _count_dirs(self):
+		""" generator counting the queued directories, one at a time; yields after each directory diffed """
+		while self._count_queue:
+			node = self._count_queue.pop(0)
+			if node.counts is not None:
+				continue
+			yield from self._count_trees(node.old_id, node.new_id)
+			node.counts = self._count_cache[(node.old_id, node.new_id)]
+			siblings = node.parent.children
+			if node.row < len(siblings) and siblings[node.row] is node:  # still shown
+				index = self.createIndex(node.row, 1, node)
+				self.dataChanged.emit(index, index)
+
+	def _count_trees(self, old_id, new_id):
+		""" generator: files per status below a pair of trees, into _count_cache; yields after each directory """
+		key = (old_id, new_id)
+		if key in self._count_cache:
+			return
+		counts = {}
+		for _name, status, o_id, n_id, type_str in tree_changes(self.repo, old_id, new_id):
+			if type_str == 'tree':
+				yield from self._count_trees(o_id, n_id)
+				for sub_status, count in self._count_cache[(o_id, n_id)].items():
+					counts[sub_status] = counts.get(sub_status, 0) + count
+			else:
+				counts[status] = counts.get(status, 0) + 1
+		self._count_cache[key] = counts
+		yield
+
+	def _node(self, index):
+		return index.internalPointer() if index.isValid() else self.root
+
+	def patch_at(self, index):
+		""" Patch for a file row, None for directories """
+		node = self._node(index)
+		if node.is_dir:
+			return None
+		return Patch(node.path, node.status, node.new_id, node.old_id, gitlink=node.gitlink)
+
+	def index(self, row, column, parent=QtCore.QModelIndex()):
+		if not self.hasIndex(row, column, parent):
+			return QtCore.QModelIndex()
+		return self.createIndex(row, column, self._node(parent).children[row])
+
+	def parent(self, index=QtCore.QModelIndex()):  # pylint: disable=arguments-differ
+		if not index.isValid():
+			return QtCore.QModelIndex()
+		node = index.internalPointer().parent
+		if node is self.root:
+			return QtCore.QModelIndex()
+		return self.createIndex(node.row, 0, node)
+
+	def rowCount(self, parent=QtCore.QModelIndex()):
+		if parent.column() > 0:
+			return 0
+		node = self._node(parent)
+		return len(node.children) if node.children is not None else 0
+
+	def columnCount(self, parent=QtCore.QModelIndex()):
+		del parent
+		return 2
+
+	def hasChildren(self, parent=QtCore.QModelIndex()):
+		return self._node(parent).is_dir
+
+	def canFetchMore(self, parent=QtCore.QModelIndex()):
+		node = self._node(parent)
+		return node.is_dir and node.entries is None
+
+	def fetchMore(self, parent=QtCore.QModelIndex()):
+		node = self._node(parent)
+		node.entries = self._diff_dir(node)
+		children = [c for c in node.entries if self._shown(c)]
+		self._number(children)
+		if not children:
+			node.children = []
+			return
+		self.beginInsertRows(parent, 0, len(children) - 1)
+		node.children = children
+		self.endInsertRows()
+		self._queue_counts(children)
+
+	def data(self, index, role):
+		node = self._node(index)
+		col = index.column()
+
+		ret = None
+		if role == Qt.DisplayRole:
+			if col == 0:
+				ret = node.name
+			elif col == 1:
+				if node.is_dir:
+					if node.counts is not None:
+						ret = ' '.join(f'{s}{n}' for s, n in sorted(node.counts.items()))
+				else:
+					ret = node.status
+		elif role == Qt.ToolTipRole:
+			ret = node.path
+		elif role == Qt.ForegroundRole:
+			if node.status == 'D':
+				ret = QtGui.QColor(Qt.red)
+			elif node.status == 'A':
+				ret = QtGui.QColor(Qt.green)
 
 		return ret
 
 	def headerData(self, section, orientation, role):
 		if role == Qt.DisplayRole and orientation == Qt.Horizontal:
-			# return {0: '', 1: 'file', 2: 'rel. path', 3: 'renamed'}[section]
-			return ['', 'file', 'rel. path', 'renamed'][section]
+			return ['file', ''][section]
 		return None
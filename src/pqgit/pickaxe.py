@@ -0,0 +1,163 @@
+""" pickaxe: find the commits that added or removed some text (like git log -S / -G)
+"""
+import re
+import itertools
+
+import pygit2
+
+from PySide2.QtCore import Qt, QTimer
+from PySide2.QtWidgets import (
+	QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QCheckBox, QPushButton, QLabel, QListWidget, QListWidgetItem
+)
+
+from pqgit.workers import search_chunk
+
+CHUNK = 200  # commits per worker task
+MAX_PENDING = 64  # tasks submitted but not collected yet
+
+
+class PickaxeSearch():
+	""" one search over the history of HEAD; feeds the executor chunk by chunk, poll() collects the results """
+	_count = itertools.count()
+
+	def __init__(self, executor, repo, needle, regex=False):
+		self.executor = executor
+		self.repo_path = repo.path
+		self.needle = needle
+		self.regex = regex
+		self.key = next(self._count)
+		self.commit_ids = (c.id.hex for c in repo.walk(repo.head.target, pygit2.GIT_SORT_NONE))
+		self.walk_done = False
+		self.futures = []
+		self.searched = 0
+		self.error = None  # what went wrong in a worker, if anything
+
+	def poll(self):
+		""" submit more chunks (without walking more than needed), return matches found since last poll """
+		while not self.walk_done and len(self.futures) < MAX_PENDING:
+			ids = list(itertools.islice(self.commit_ids, CHUNK))
+			if len(ids) < CHUNK:
+				self.walk_done = True
+			if ids:
+				self.futures.append(
+					self.executor.submit(search_chunk, self.repo_path, self.key, self.needle, self.regex, ids)
+				)
+
+		matches = []
+		pending = []
+		for future in self.futures:
+			if not future.done():
+				pending.append(future)
+				continue
+			try:
+				searched, found = future.result()
+			except Exception as ex:  #pylint: disable=broad-except
+				self.error = f'{type(ex).__name__}: {ex}'
+				continue
+			self.searched += searched
+			matches += found
+		self.futures = pending
+		return matches
+
+	def done(self):
+		""" all commits searched """
+		return self.walk_done and not self.futures
+
+	def cancel(self):
+		""" drop whatever is not running yet """
+		for future in self.futures:
+			future.cancel()
+		self.futures = []
+		self.walk_done = True
+
+
+class PickaxeDialog(QDialog):
+	""" search input, progress and the list of matching commits; clicking one selects it in the history """
+	def __init__(self, parent, repo, get_executor, select_commit):
+		super().__init__(parent)
+		self.setWindowTitle('Pickaxe')
+		self.resize(600, 500)
+		self.repo = repo
+		self.get_executor = get_executor
+		self.select_commit = select_commit
+		self.search = None
+
+		self.leNeedle = QLineEdit(self)
+		self.leNeedle.setPlaceholderText('text added or removed')
+		self.cbRegex = QCheckBox('regex', self)
+		self.pbSearch = QPushButton('search', self)
+		self.lbProgress = QLabel(self)
+		self.lwResults = QListWidget(self)
+
+		inputs = QHBoxLayout()
+		for widget in (self.leNeedle, self.cbRegex, self.pbSearch):
+			inputs.addWidget(widget)
+		layout = QVBoxLayout(self)
+		layout.addLayout(inputs)
+		layout.addWidget(self.lbProgress)
+		layout.addWidget(self.lwResults)
+
+		self.timer = QTimer(self)
+		self.timer.setInterval(100)
+		self.timer.timeout.connect(self.on_timer)
+
+		self.leNeedle.returnPressed.connect(self.start_or_cancel)
+		self.pbSearch.clicked.connect(self.start_or_cancel)
+		self.lwResults.currentItemChanged.connect(self.result_selected)
+
+	def start_or_cancel(self):
+		""" start a new search, or stop the running one """
+		if self.search is not None:
+			self.stop(f'cancelled after {self.search.searched} commits')
+			return
+
+		needle = self.leNeedle.text()
+		if not needle:
+			return
+		if self.cbRegex.isChecked():
+			try:
+				re.compile(needle)
+			except re.error as ex:
+				self.lbProgress.setText(f'bad regex: {ex}')
+				return
+
+		self.lwResults.clear()
+		self.search = PickaxeSearch(self.get_executor(), self.repo, needle, self.cbRegex.isChecked())
+		self.pbSearch.setText('cancel')
+		self.timer.start()
+		self.on_timer()
+
+	def stop(self, text):
+		""" search finished or cancelled """
+		self.timer.stop()
+		self.search.cancel()
+		self.search = None
+		self.pbSearch.setText('search')
+		self.lbProgress.setText(text)
+
+	def on_timer(self):
+		""" collect results """
+		for c_id, paths in self.search.poll():
+			summary = self.repo[c_id].message.strip().split('\n')[0]
+			item = QListWidgetItem(f'{c_id[:7]}  {summary}  ({len(paths)} files)')
+			item.setData(Qt.UserRole, c_id)
+			item.setToolTip('\n'.join(paths))
+			self.lwResults.addItem(item)
+
+		if self.search.error is not None:
+			self.stop(f'search failed after {self.search.searched} commits: {self.search.error}')
+		elif self.search.done():
+			self.stop(f'{self.lwResults.count()} commits found in {self.search.searched}')
+		else:
+			self.lbProgress.setText(f'{self.search.searched} commits searched, {self.lwResults.count()} found...')
+
+	def result_selected(self, item):
+		""" show the commit in the history """
+		if item is not None:
+			self.select_commit(item.data(Qt.UserRole))
+
+	def closeEvent(self, event):  # pylint: disable=invalid-name
+		""" stop searching when closed """
+		if self.search is not None:
+			self.stop('')
+		super().closeEvent(event)
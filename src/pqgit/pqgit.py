@@ -5,25 +5,33 @@ import sys
 import tempfile
 import subprocess
 import difflib
+import itertools
+import multiprocessing
 import re
+import time
 
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 
 import pygit2
 
 from PySide2.QtWidgets import (
-	QApplication, QMainWindow, QHeaderView, QAbstractItemView, QMessageBox, QShortcut, QFileDialog
+	QApplication, QMainWindow, QHeaderView, QAbstractItemView, QMessageBox, QShortcut, QFileDialog, QTabWidget
 )
 
 from PySide2.QtCore import (
-	QItemSelectionModel, QItemSelection, QSettings, QPoint, QSize, QTimer, QDir, QFileSystemWatcher, Qt
+	QItemSelectionModel, QItemSelection, QModelIndex, QSettings, QPoint, QSize, QTimer, QDir, QFileSystemWatcher, Qt
 )
 
 from PySide2.QtGui import QFont, QIcon, QKeySequence
 
 from pqgit import ui
-from pqgit.model import BranchesModel, HistoryModel, FilesModel, Branch, Commit, Patch
-from pqgit.util import STYLES, GIT_STATUS, parse_tree_rec
+from pqgit.model import BranchesModel, HistoryModel, FilesModel, FilesTreeModel, Branch, Commit, Patch, FETCH_BATCH
+from pqgit.commitgraph import CommitGraph
+from pqgit.pickaxe import PickaxeDialog
+from pqgit.renames import RenameDetection, RENAME_LIMIT, TIME_BUDGET
+from pqgit.util import STYLES, GIT_STATUS, parse_tree_rec, changed_files
+from pqgit.workdiff import WorkingDiff
 
 import pkg_resources  # part of setuptools
 VERSION = pkg_resources.require("pqgit")[0].version
@@ -32,6 +40,12 @@ VERSION = pkg_resources.require("pqgit")[0].version
 _html_diff = difflib.HtmlDiff(tabsize=4)  #pylint: disable=invalid-name
 _html_diff._styles = STYLES  #pylint: disable=protected-access
 
+# diffs with more files than this are shown as a tree, filled in as directories get expanded
+LARGE_DIFF = 5000
+
+# default for all tabs together (history rows, file rows, ...); background tabs get evicted beyond this
+MEMORY_BUDGET = 500000
+
 
 @dataclass
 class Proc():
@@ -42,42 +56,78 @@ class Proc():
 	running: bool
 
 
-class Pqgit(QMainWindow):
-	""" main class / entry point """
-	def __init__(self):
+def make_commit(c):
+	""" history row for a pygit2 commit """
+	return Commit(
+		id=c.id.hex,
+		tree_id=c.tree_id.hex,
+		author=c.author,
+		dt=c.commit_time,
+		dt_offs=c.commit_time_offset,
+		message=c.message.strip()
+	)
+
+
+class RepoTab(QMainWindow):
+	""" one open repo: branches, history, files and diff (the generated main window ui, embedded in a tab) """
+	def __init__(self, main, dir_name, load=True):
 		super().__init__()
-		self.setAttribute(Qt.WA_DeleteOnClose)  # let Qt delete stuff before the python garbage-collector gets to work
+		self.setWindowFlags(Qt.Widget)
+		self.main = main
+		self.dir_name = dir_name
 		self.repo = None
+		self.commit_graph = None
 		self.branches_model = None
 
 		# instantiate main window
 		self.ui = ui.Ui_MainWindow()
 		self.ui.setupUi(self)
+		self.menuBar().hide()
+		self.statusBar().hide()
+
+		# background tabs don't watch anything; inactive ones may get their rows evicted (see Pqgit.enforce_budget)
+		self.last_active = time.monotonic()
+		self.suspended = False
+		self.evicted = False
+		self.restore = None  # (history ids, file path) selected before eviction
 
 		self.fs_watch = QFileSystemWatcher(self)
 		self.fs_watch.fileChanged.connect(self.on_file_changed)
 		self.fs_watch.directoryChanged.connect(self.on_dir_changed)
 
-		self.settings = QSettings(QSettings.IniFormat, QSettings.UserScope, 'pqgit', 'config')
+		# .git dir and refs/**; git replaces ref files by renaming, so watching the directories is enough
+		self.refs_watch = QFileSystemWatcher(self)
+		self.refs_watch.directoryChanged.connect(self.on_refs_changed)
+		self.refs_timer = QTimer(self)  # one commit/fetch touches lots of files in .git; look once they're done
+		self.refs_timer.setSingleShot(True)
+		self.refs_timer.setInterval(100)
+		self.refs_timer.timeout.connect(self.check_refs)
+		self.head_id = None  # HEAD shown in history
+
+		self.settings = main.settings
 
 		# for comparison
 		self.new_c_id, self.old_c_id = None, None
 
-		# window icon
-		cwd = os.path.dirname(os.path.realpath(__file__))
-		self.setWindowIcon(QIcon(os.path.join(cwd, 'Git-Icon-White.png')))
-		self.setWindowTitle('pqgit')
+		# in-memory diff of the working directory, updated from file watcher events
+		self.working_diff = None
+		self.working_shown = False
 
-		# size and position
-		self.move(self.settings.value('w/pos', QPoint(200, 200)))
-		self.resize(self.settings.value('w/size', QSize(1000, 1000)))
+		# renames and copies, found bit by bit after the files list is shown
+		self.renames = None
+		self.similarity_scores = {}  # (old blob id, new blob id) -> similarity, kept between diffs
+		self.renames_timer = QTimer(self)
+		self.renames_timer.setInterval(0)
+		self.renames_timer.timeout.connect(self.detect_renames)
+
+		# splitters
 		self.ui.hist_splitter.setSizes([int(s) for s in self.settings.value('w/hist_splitter', [720, 360])])
 		self.ui.cinf_splitter.setSizes([int(s) for s in self.settings.value('w/cinf_splitter', [360, 360])])
 		self.ui.diff_splitter.setSizes([int(s) for s in self.settings.value('w/diff_splitter', [150, 1200, 230])])
 
-		# open repo dir
-		open_shortcut = QShortcut(QKeySequence('Ctrl+O'), self)
-		open_shortcut.activated.connect(self.open_dir)
+		# panels, opened with shortcuts of the main window
+		self.analytics = None
+		self.pickaxe = None
 
 		# set-up ui
 		self.branches_model = BranchesModel()
@@ -89,13 +139,22 @@ class Pqgit(QMainWindow):
 		self.ui.tvHistory.setModel(self.history_model)
 		self.ui.tvHistory.selectionModel().selectionChanged.connect(self.history_selection_changed)
 
+		# files: flat list, or a lazily filled tree for big diffs
 		self.files_model = FilesModel()
-		self.ui.tvFiles.setModel(self.files_model)
-		self.ui.tvFiles.selectionModel().selectionChanged.connect(self.files_selection_changed)
+		self.files_tree_model = None
+		self.files_filtered = False  # rows of the flat list hidden by the files filter
+		self.set_files_model(self.files_model)
+		self.ui.tvFiles.setUniformRowHeights(True)
+		self.ui.tvFiles.header().setStretchLastSection(False)
 
 		self.ui.tvFiles.doubleClicked.connect(self.on_file_doubleclicked)
+		self.filter_timer = QTimer(self)  # filter once typing pauses
+		self.filter_timer.setSingleShot(True)
+		self.filter_timer.setInterval(250)
+		self.filter_timer.timeout.connect(self.files_filter_changed)
+		self.ui.leFilesFilter.textChanged.connect(lambda _text: self.filter_timer.start())
 
-		for view in (self.ui.tvBranches, self.ui.tvHistory, self.ui.tvFiles):
+		for view in (self.ui.tvBranches, self.ui.tvHistory):
 			view.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
 			view.setSelectionBehavior(QAbstractItemView.SelectRows)
 			view.setShowGrid(False)
@@ -106,55 +165,37 @@ class Pqgit(QMainWindow):
 
 		self.difftools = []
 
-		timer = QTimer(self)
-		timer.timeout.connect(self.on_timer)
-		timer.start(5000)
-
-		self.dir_name = self.settings.value('last_opened_repo', None)
-
-		try:
-			pygit2.Repository(self.dir_name)
-		except Exception:  #pylint: disable=broad-except
-			self.open_dir()
-			return
-
-		self.open_repo()
-
-	def open_dir(self):
-		""" show open dir dialog and open repo """
-		last_dir = self.settings.value('last_fileopen_dir', '')
+		# opening is cheap; branches, history and watches are read by open_repo(), maybe only when first shown
+		self.repo = pygit2.Repository(self.dir_name)
+		self.loaded = False
+		if load:
+			self.open_repo()
+		else:
+			self.suspended = True
 
-		fd = QFileDialog(self, 'Open .git', last_dir)
-		fd.setFileMode(QFileDialog.DirectoryOnly)
-		fd.setFilter(QDir.Filters(QDir.Dirs | QDir.Hidden | QDir.NoDot | QDir.NoDotDot))
+	def open_repo(self):
+		""" called once, when the tab is created or first shown """
+		self.loaded = True
+		self.watch()
+		self.head_id = None
 
-		while True:
-			if not fd.exec():
-				return
-			self.dir_name = fd.selectedFiles()[0]
-			parent = os.path.dirname(self.dir_name)
-			self.settings.setValue('last_fileopen_dir', parent)
-			self.settings.setValue('last_opened_repo', self.dir_name)
+		branches, selected_branch_row = self.list_branches()
 
-			try:
-				pygit2.Repository(self.dir_name)
-				break
-			except pygit2.GitError:
-				QMessageBox(self, text='Cannot open repo: ' + self.dir_name).exec()
+		self.branches_model.update(branches)
 
-		self.open_repo()
+		idx1 = self.branches_model.index(selected_branch_row, 0)
+		idx2 = self.branches_model.index(selected_branch_row, self.branches_model.columnCount() - 1)
+		self.ui.tvBranches.selectionModel().select(QItemSelection(idx1, idx2), QItemSelectionModel.Select)
 
-	def open_repo(self):
-		""" called either on start or after open dialog """
+		self.ui.tvHistory.resizeColumnsToContents()
 
-		self.setWindowTitle(f'{self.dir_name} - pqgit ({VERSION})')
-		self.repo = pygit2.Repository(self.dir_name)
+	def title(self):
+		""" short name for the tab """
+		return os.path.basename(os.path.normpath(self.repo.workdir or self.repo.path))
 
-		# remove existing files and folder from watch
-		if self.fs_watch.files():
-			self.fs_watch.removePaths(self.fs_watch.files())
-		if self.fs_watch.directories():
-			self.fs_watch.removePaths(self.fs_watch.directories())
+	def watch(self):
+		""" (re)start watching the working directory and refs """
+		self.unwatch()
 
 		wd = self.repo.workdir
 		self.fs_watch.addPath(wd)
@@ -170,7 +211,96 @@ class Pqgit(QMainWindow):
 		self.fs_watch.addPaths([wd + p for p, f in self.repo.status().items() if GIT_STATUS[f] != 'I'])
 		# (doesn't matter some are in both lists, already monitored ones will not be added by Qt)
 
-		# local branches
+		self.refs_watch.addPaths(self.refs_dirs())
+
+	def unwatch(self):
+		""" stop all file system watching """
+		for watch in (self.fs_watch, self.refs_watch):
+			paths = watch.files() + watch.directories()
+			if paths:
+				watch.removePaths(paths)
+		self.refs_timer.stop()
+
+	def suspend(self):
+		""" tab went to the background """
+		if not self.suspended:
+			self.suspended = True
+			self.unwatch()
+
+	def resume(self):
+		""" tab is shown again: watch again and catch up with whatever happened meanwhile """
+		self.last_active = time.monotonic()
+		if not self.suspended:
+			return
+		self.suspended = False
+		if not self.loaded:
+			self.open_repo()
+			return
+
+		self.watch()
+		self.working_diff = None  # file events were missed
+
+		if self.evicted:
+			self.evicted = False
+			history_ids, path = self.restore
+			self.restore = None
+			self.check_refs()  # head_id is None: reads branches and history again
+			for c_id in history_ids:
+				self.select_commit(c_id, add=True)
+			if path and self.ui.tvFiles.model() is self.files_model:
+				self.select_row(self.ui.tvFiles, self.files_model, path)
+		else:
+			self.check_refs()
+			self.update_working_row()
+
+	def memory_rows(self):
+		""" rough size of what the tab holds: history rows, file rows, working directory entries, tree nodes """
+		rows = len(self.history_model.commits) + len(self.files_model.patches)
+		if self.working_diff is not None:
+			rows += len(self.working_diff.patches) + len(self.working_diff.stats)
+		if self.files_tree_model is not None:
+			rows += self.files_tree_model.node_count
+		if self.analytics is not None:
+			rows += len(self.analytics.stats)
+		return rows + len(self.similarity_scores)
+
+	def evict(self):
+		""" drop history rows, diffs and trees (of a background tab); resume() reads what's needed again """
+		selection = self.ui.tvHistory.selectionModel().selectedRows()
+		selected = [self.history_model.commits[idx.row()].id for idx in selection]
+		patch = self.selected_patch()
+		self.restore = ([c_id for c_id in selected if c_id != 'working'], patch.path if patch else None)
+		self.evicted = True
+
+		if self.analytics is not None:
+			self.analytics.close()
+			self.analytics.deleteLater()
+			self.analytics = None
+		self.working_diff = None
+		self.stop_renames()
+		self.similarity_scores = {}
+		self.history_model.update([])
+		self.set_files_model(self.files_model)
+		self.files_tree_model = None
+		self.files_model.update([])
+		self.head_id = None
+		if self.commit_graph is not None:
+			self.commit_graph.close()
+			self.commit_graph = None
+
+	def close_tab(self):
+		""" tab is about to go away """
+		self.on_timer()  # delete any left temp files
+		self.unwatch()
+		self.stop_renames()
+		if self.pickaxe is not None:
+			self.pickaxe.close()
+		if self.commit_graph is not None:
+			self.commit_graph.close()
+			self.commit_graph = None
+
+	def list_branches(self):
+		""" local branches and tags; returns them and the row of the checked-out branch """
 		branches = []
 		selected_branch_row = 0
 		for idx, b_str in enumerate(self.repo.branches.local):
@@ -185,13 +315,114 @@ class Pqgit(QMainWindow):
 
 		branches += [Branch(name=t[10:], ref=t, c_o=False) for t in tags]
 
+		return branches, selected_branch_row
+
+	def refs_dirs(self):
+		""" directories to watch for ref changes: .git itself (HEAD, packed-refs) and everything under refs """
+		git_dir = self.repo.path
+		dirs = [git_dir]
+		for root, _dirs, _files in os.walk(os.path.join(git_dir, 'refs')):
+			dirs.append(root)
+		return dirs
+
+	def on_refs_changed(self, path):
+		""" something in .git changed; check refs once things settle """
+		del path
+		self.refs_timer.start()
+
+	def check_refs(self):
+		""" refs changed outside (commit, fetch, rebase, ... from a terminal); update branches and history """
+		self.refs_watch.addPaths(self.refs_dirs())  # new refs/heads/<some>/ dirs
+
+		branches, selected_branch_row = self.list_branches()
 		self.branches_model.update(branches)
 
-		idx1 = self.branches_model.index(selected_branch_row, 0)
-		idx2 = self.branches_model.index(selected_branch_row, self.branches_model.columnCount() - 1)
-		self.ui.tvBranches.selectionModel().select(QItemSelection(idx1, idx2), QItemSelectionModel.Select)
+		selection_model = self.ui.tvBranches.selectionModel()
+		if branches and not selection_model.isRowSelected(selected_branch_row, self.ui.tvBranches.rootIndex()):
+			# some other branch got checked out; show it, but don't check it out again
+			selection_model.blockSignals(True)
+			selection_model.clearSelection()
+			self.select_row(self.ui.tvBranches, self.branches_model, branches[selected_branch_row].ref)
+			selection_model.blockSignals(False)
+			self.ui.tvBranches.viewport().update()
+
+		head_id = self.repo.head.target.hex
+		if head_id == self.head_id:
+			return
 
-		self.ui.tvHistory.resizeColumnsToContents()
+		if self.head_id and self.is_descendant(head_id, self.head_id):
+			self.prepend_history(head_id)
+		else:
+			# rebase, reset, checkout, ...
+			self.reload_history()
+
+	def is_descendant(self, desc_id, anc_id):
+		""" whether commit anc_id is in the history of desc_id; walks the commit-graph when both are in it """
+		graph = self.commit_graph
+		if graph is not None:
+			desc, anc = graph.find(desc_id), graph.find(anc_id)
+			if desc is not None and anc is not None:
+				return desc != anc and graph.is_ancestor(anc, desc)
+		return self.repo.descendant_of(desc_id, anc_id)
+
+	def prepend_history(self, head_id):
+		""" HEAD moved forward: walk only the new commits and add them on top """
+		walker = self.repo.walk(head_id, pygit2.GIT_SORT_TOPOLOGICAL)
+		walker.hide(self.head_id)
+		commits = [make_commit(c) for c in walker]
+		self.head_id = head_id
+
+		working_row = self.history_model.commits and self.history_model.commits[0].id == 'working'
+		self.history_model.insert_rows(1 if working_row else 0, commits)
+
+		# committing usually cleans (part of) the working directory
+		self.update_working_row()
+
+	def update_working_row(self):
+		""" add or remove the 'working' row, depending on the working directory being clean """
+		working_row = self.history_model.commits and self.history_model.commits[0].id == 'working'
+		if self.repo.status():
+			if not working_row:
+				self.history_model.insert_rows(0, [Commit('working', 'working', None, None, None, None)])
+			elif self.ui.tvHistory.selectionModel().isRowSelected(0, self.ui.tvHistory.rootIndex()):
+				# compare 'working' to the new parent
+				self.history_selection_changed(QItemSelection())
+		elif working_row:
+			self.history_model.remove_rows(0, 1)
+
+	def show_analytics(self):
+		""" open the analytics panel for the loaded history (needs numpy) """
+		try:
+			from pqgit.analytics import AnalyticsDialog  # pylint: disable=import-outside-toplevel
+		except ImportError:
+			QMessageBox(self, text='Analytics need numpy: pip install pqgit[analytics]').exec()
+			return
+
+		if self.analytics is None:
+			self.analytics = AnalyticsDialog(self, self.repo, self.history_model, self.main.executor)
+		self.analytics.show()
+		self.analytics.raise_()
+
+	def show_pickaxe(self):
+		""" open the pickaxe search (commits adding/removing some text) """
+		if self.pickaxe is None:
+			self.pickaxe = PickaxeDialog(self, self.repo, self.main.executor, self.select_commit)
+		self.pickaxe.show()
+		self.pickaxe.raise_()
+
+	def select_commit(self, c_id, add=False):
+		""" select (and scroll to) a commit in the history, reading more of it if needed """
+		row = self.history_model.row_of(c_id)
+		while row is None and self.history_model.canFetchMore():
+			self.history_model.fetchMore()
+			row = self.history_model.row_of(c_id)
+		if row is None:
+			return
+
+		if not add:
+			self.ui.tvHistory.selectionModel().clearSelection()
+		self.select_row(self.ui.tvHistory, self.history_model, c_id)
+		self.ui.tvHistory.scrollTo(self.history_model.index(row, 0))
 
 	def on_timer(self):
 		""" poll opened diff tools (like meld) and close temp files when finished """
@@ -207,39 +438,96 @@ class Pqgit(QMainWindow):
 
 	def on_file_changed(self, path):
 		""" existing files edited """
-		patch = self.files_model.patches[self.ui.tvFiles.selectionModel().selectedRows()[0].row()]
-		if self.repo.workdir + patch.path == path:
+		if os.path.exists(path):
+			# editors saving by replacing the file make Qt drop it from the watch
+			self.fs_watch.addPath(path)
+
+		self.working_changed([path])
+		if self.working_shown:
+			return
+
+		patch = self.selected_patch()
+		if patch and self.repo.workdir + patch.path == path:
 			self.files_selection_changed()
 
 	def on_dir_changed(self, path):
-		""" file added/deleted; refresh history to show it in 'working' """
+		""" file added/deleted; update 'working' in place """
+		self.working_changed([path])
+
+	def working_changed(self, paths):
+		""" file watcher events: update the working diff and add or remove the 'working' row, without a reload """
+		head_tree = self.repo.revparse_single('HEAD').tree
+		if self.working_diff is None or (self.working_diff.base_id != head_tree.id.hex and not self.working_shown):
+			# one full scan; later events only re-diff their paths
+			self.working_diff = WorkingDiff(self.repo, head_tree)
+		else:
+			self.update_working(paths)
+
+		if self.working_diff.base_id == head_tree.id.hex:
+			dirty = bool(self.working_diff.patches)
+		else:
+			dirty = bool(self.repo.status())  # 'working' is shown compared to an older commit; ask git
+
+		working_row = self.history_model.commits and self.history_model.commits[0].id == 'working'
+		if dirty and not working_row:
+			self.history_model.insert_rows(0, [Commit('working', 'working', None, None, None, None)])
+		elif not dirty and working_row:
+			self.history_model.remove_rows(0, 1)
+
+	def reload_history(self):
+		""" refresh history, keeping the selected commits and file """
 		# remember history selection
 		history_ids = []
 		for idx in self.ui.tvHistory.selectionModel().selectedRows():
 			history_ids.append(self.history_model.commits[idx.row()].id)
 
-		bak_path = self.files_model.patches[self.ui.tvFiles.selectionModel().selectedRows()[0].row()].path
+		bak_patch = self.selected_patch()
 
 		self.refresh_history()
 
-		# restore history selection
+		# models only signal what changed, so usually the selection is still there; restore it in case rows were reset
 		for i in history_ids:
-			for row, c in enumerate(self.history_model.commits):
-				if c.id == i:
-					idx1 = self.history_model.index(row, 0)
-					idx2 = self.history_model.index(row, self.history_model.columnCount() - 1)
-					self.ui.tvHistory.selectionModel().select(QItemSelection(idx1, idx2), QItemSelectionModel.Select)
-
-		# restore file selection
-		if not bak_path:
+			self.select_row(self.ui.tvHistory, self.history_model, i)
+
+		if bak_patch and self.ui.tvFiles.model() is self.files_model:
+			self.select_row(self.ui.tvFiles, self.files_model, bak_patch.path)
+
+	@staticmethod
+	def select_row(view, model, key):
+		""" select the row with some key (commit id, path, ...) in view, if not already selected """
+		row = model.row_of(key)
+		if row is None:
+			return
+		selection_model = view.selectionModel()
+		if selection_model.isRowSelected(row, view.rootIndex()):
+			return
+		idx1 = model.index(row, 0)
+		idx2 = model.index(row, model.columnCount() - 1)
+		selection_model.select(QItemSelection(idx1, idx2), QItemSelectionModel.Select)
+
+	def update_working(self, paths):
+		""" re-diff only the given paths and apply the result to the 'working' file list row by row """
+		changed, removed = self.working_diff.update(paths)
+		if not changed and not removed:
 			return
-		for row, patch in enumerate(self.files_model.patches):
-			if patch.path == bak_path:
-				idx1 = self.files_model.index(row, 0)
-				idx2 = self.files_model.index(row, self.files_model.columnCount() - 1)
 
-				self.ui.tvFiles.selectionModel().select(QItemSelection(idx1, idx2), QItemSelectionModel.Select)
-				break
+		new_paths = [self.repo.workdir + p.path for p in changed if os.path.exists(self.repo.workdir + p.path)]
+		if new_paths:
+			self.fs_watch.addPaths(new_paths)
+
+		if not self.working_shown:
+			return
+
+		sel_patch = self.selected_patch()
+
+		for patch in changed:
+			self.files_model.set_patch(patch)
+		for rem_path in removed:
+			self.files_model.remove_path(rem_path)
+		self.filter_files_list([p.path for p in changed])
+
+		if sel_patch and any(p.path == sel_patch.path for p in changed):
+			self.files_selection_changed()
 
 	def refresh_history(self):
 		""" called and branch check-out (which is also called during start-up) to populate commit log """
@@ -250,30 +538,48 @@ class Pqgit(QMainWindow):
 		if len(status.items()) > 0:
 			commits.append(Commit('working', 'working', None, None, None, None))
 
-		for c in self.repo.walk(self.repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL):
-			commit = Commit(
-				id=c.id.hex,
-				tree_id=c.tree_id.hex,
-				author=c.author,
-				dt=c.commit_time,
-				dt_offs=c.commit_time_offset,
-				message=c.message.strip()
-			)
-			commits.append(commit)
+		# only the first rows are read now (at least as many as already shown); the view fetches the rest on scroll
+		self.head_id = self.repo.head.target.hex
+		pending = self.history_commits()
+		count = max(FETCH_BATCH, len(self.history_model.commits))
+		commits += itertools.islice(pending, count)
 
-		self.history_model.update(commits)
+		self.history_model.update(commits, pending)
 		self.ui.tvHistory.resizeColumnsToContents()
 
+	def history_commits(self):
+		""" generator over the commits of HEAD, children before parents """
+		if self.commit_graph is not None:
+			self.commit_graph.close()
+		self.commit_graph = CommitGraph.open(self.repo.path)
+
+		graph = self.commit_graph
+		tip = graph.find(self.head_id) if graph is not None else None
+		if tip is not None and graph.has_generations():
+			# order from the commit-graph file; objects are read only for rows being shown
+			commits = (self.repo[graph.oid_hex(pos)] for pos in graph.topo_order([tip]))
+		else:
+			# no commit-graph, or written before HEAD moved
+			commits = self.repo.walk(self.head_id, pygit2.GIT_SORT_TOPOLOGICAL)
+
+		for c in commits:
+			yield make_commit(c)
+
 	def branches_selection_changed(self):
 		""" checkout selected branch """
-		selected_row = self.ui.tvBranches.selectionModel().selectedRows()[0].row()
+		selected_rows = self.ui.tvBranches.selectionModel().selectedRows()
+		if not selected_rows:
+			return
+		selected_row = selected_rows[0].row()
 		self.repo.checkout(self.branches_model.branches[selected_row].ref, strategy=pygit2.GIT_CHECKOUT_SAFE)
 		self.refresh_history()
 
 	def on_file_doubleclicked(self, index):
 		""" get files contents for revisions and start diff tool """
 
-		patch = self.files_model.patches[index.row()]
+		patch = self.ui.tvFiles.model().patch_at(index)
+		if patch is None:
+			return  # directory
 		if not patch.old_file_id:
 			msg_box = QMessageBox(self)
 			msg_box.setText("Nothing to compare to.")
@@ -303,13 +609,15 @@ class Pqgit(QMainWindow):
 
 		self.ui.teDiff.setText('')
 		self.new_c_id, self.old_c_id = None, None
+		self.working_shown = False
+		self.stop_renames()
 
 		selection_model = self.ui.tvHistory.selectionModel()
 		selected_rows = selection_model.selectedRows()
 		self.ui.teCommit.setPlainText('')
 
 		commit = None
-		fst_tid, fst_obj = None, None
+		fst_tid = None
 		snd_tid, snd_obj = None, None
 
 		if len(selected_rows) < 1:
@@ -327,6 +635,8 @@ class Pqgit(QMainWindow):
 			commit = self.history_model.commits[selected_rows[0].row()]
 			fst_tid = commit.tree_id
 
+			if selected_rows[0].row() + 1 == self.history_model.rowCount() and self.history_model.canFetchMore():
+				self.history_model.fetchMore()
 			if selected_rows[0].row() + 1 < self.history_model.rowCount():
 				# there is a parent, get it's id to compare to it
 				snd_commit = self.history_model.commits[selected_rows[0].row() + 1]
@@ -351,53 +661,132 @@ class Pqgit(QMainWindow):
 			self.new_c_id = commit.id
 			self.old_c_id = snd_commit.id
 
-		if fst_tid != 'working':
-			fst_obj = self.repo.revparse_single(fst_tid)
-
 		if snd_tid:
 			snd_obj = self.repo.revparse_single(snd_tid)
 
-		diff = None
+		tree_ids = None
 		if fst_tid == 'working':
-			# diff for working directory only shows... some files; get them anyway, then insert the ones from status
-			diff = self.repo.diff(snd_obj, None)  # regardless of snd_obj being something or None
-			patches = [
-				Patch(
-					p.delta.new_file.path.strip(),  #
-					p.delta.status_char(),
-					None,  # p.delta.new_file.id.hex is 'some' id, but it's somehow not ok...
-					p.delta.old_file.id.hex if p.delta.old_file.id.hex.find('00000') < 0 else None,
-				) for p in diff
-			]
-			inserted = [p.delta.new_file.path for p in diff]
-			status = self.repo.status()
-			for path, flags in status.items():
-				if path not in inserted:
-					patches.append(Patch(path.strip(), GIT_STATUS[flags], None, None))
-
-		elif snd_obj:
-			diff = self.repo.diff(snd_obj, fst_obj)
-
-			patches = [
-				Patch(
-					p.delta.new_file.path.strip(),  #
-					p.delta.status_char(),
-					p.delta.new_file.id.hex if p.delta.new_file.id.hex.find('00000') < 0 else None,
-					p.delta.old_file.id.hex if p.delta.old_file.id.hex.find('00000') < 0 else None,
-				) for p in diff
-			]
+			# full diff only when comparing to another base; afterwards file watcher events keep it up to date
+			if self.working_diff is None or self.working_diff.base_id != snd_tid:
+				self.working_diff = WorkingDiff(self.repo, snd_obj)
+			patches = list(self.working_diff.patches.values())
+			self.working_shown = True
 
 		else:
-			# initial revision
-			patches = [Patch(o[0], 'A', o[1], None) for o in parse_tree_rec(fst_obj)]
+			# 2 revisions, or the initial one; walking the trees stops after LARGE_DIFF files
+			files = changed_files(self.repo, snd_tid, fst_tid, LARGE_DIFF)
+			if files is None:
+				tree_ids = (snd_tid, fst_tid)
+			else:
+				patches = [
+					Patch(path, status, new_id, old_id, gitlink=type_str == 'commit')
+					for path, status, old_id, new_id, type_str in files
+				]
+
+		if tree_ids:
+			# too many files for a flat list; directories get diffed as they're expanded
+			self.files_tree_model = FilesTreeModel(self.repo, *tree_ids)
+			self.files_tree_model.set_prefix(self.ui.leFilesFilter.text())
+			self.set_files_model(self.files_tree_model)
+			return
 
+		self.set_files_model(self.files_model)
+		self.files_tree_model = None
 		patches = sorted(patches, key=lambda p: p.path)
 		self.files_model.update(patches)
-		self.ui.tvFiles.resizeColumnsToContents()
+		self.filter_files_list()
+
+		if self.ui.tvFiles.selectionModel().selectedRows():
+			# same file is still there (rows are not reset), show it for the new selection
+			self.files_selection_changed()
+
+		if fst_tid != 'working' and any(p.status == 'A' for p in patches):
+			self.renames = RenameDetection(
+				self.repo,
+				patches,
+				self.similarity_scores,
+				int(self.settings.value('rename_limit', RENAME_LIMIT)),
+				float(self.settings.value('rename_time_budget', TIME_BUDGET)),
+			)
+			self.renames_timer.start()
+
+	def detect_renames(self):
+		""" a slice of rename detection; renamed or copied files replace their added (and deleted) rows """
+		done = self.renames.step()
+		found, removed = self.renames.take()
+		if found or removed:
+			selected = self.selected_patch()
+			for path in removed:
+				self.files_model.remove_path(path)
+			for patch in found:
+				self.files_model.set_patch(patch)
+			self.filter_files_list([p.path for p in found])
+			if selected is not None and selected.path in {p.path for p in found}:
+				self.files_selection_changed()
+		if done:
+			self.stop_renames()
+
+	def stop_renames(self):
+		""" stop looking for renames, if still looking """
+		self.renames_timer.stop()
+		self.renames = None
+
+	def set_files_model(self, model):
+		""" show the flat files list or the files tree in tvFiles """
+		if self.ui.tvFiles.model() is model:
+			return
+		self.ui.tvFiles.setModel(model)
+		self.files_filtered = False  # the view forgets hidden rows with its model
+		self.ui.tvFiles.selectionModel().selectionChanged.connect(self.files_selection_changed)
+
+		is_tree = model is not self.files_model
+		self.ui.tvFiles.setRootIsDecorated(is_tree)
+		header = self.ui.tvFiles.header()
+		header.setSectionResizeMode(0 if is_tree else 1, QHeaderView.Stretch)
+		header.setSectionResizeMode(1 if is_tree else 0, QHeaderView.ResizeToContents)
+		if not is_tree:
+			header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
+
+	def selected_patch(self):
+		""" Patch of the selected file, None if nothing (or a directory) is selected """
+		selected_rows = self.ui.tvFiles.selectionModel().selectedRows()
+		if not selected_rows:
+			return None
+		return self.ui.tvFiles.model().patch_at(selected_rows[0])
+
+	def files_filter_changed(self):
+		""" path prefix typed in the files filter """
+		if self.ui.tvFiles.model() is self.files_tree_model:
+			self.files_tree_model.set_prefix(self.ui.leFilesFilter.text())
+		else:
+			self.filter_files_list()
+
+	def filter_files_list(self, paths=None):
+		"""
+		hide rows of the flat files list not matching the path prefix; only the rows of paths, if given (hidden
+		rows move along with inserts and removals, so only inserted or replaced ones need a look)
+		"""
+		prefix = self.ui.leFilesFilter.text().strip().strip('/')
+		if not prefix and not self.files_filtered:
+			return
+		if paths is None:
+			rows = enumerate(self.files_model.patches)
+			self.files_filtered = bool(prefix)
+		else:
+			rows = [self.files_model.row_of(path) for path in paths]
+			rows = [(row, self.files_model.patches[row]) for row in rows if row is not None]
+		for row, patch in rows:
+			self.ui.tvFiles.setRowHidden(row, QModelIndex(), not patch.path.startswith(prefix))
 
 	def files_selection_changed(self):
 		""" show diff (or file content for new, ignored, ... files) """
-		patch = self.files_model.patches[self.ui.tvFiles.selectionModel().selectedRows()[0].row()]
+		patch = self.selected_patch()
+		if patch is None:
+			return
+		if patch.gitlink:
+			# the ids are commits of the submodule's repo
+			self.ui.teDiff.setText(f'submodule {patch.path}: {patch.old_file_id} -> {patch.new_file_id}')
+			return
 
 		nf_data, of_data = None, None  # new_file, old_file
 		if patch.new_file_id:
@@ -437,21 +826,194 @@ class Pqgit(QMainWindow):
 
 		self.ui.diff_groupbox.setTitle('Diff' if nf_data and of_data else 'File')
 
-	def closeEvent(self, event):  # pylint: disable=invalid-name, no-self-use
+
+class Pqgit(QMainWindow):
+	""" main class / entry point; one tab per open repo, sharing a worker pool and a memory budget """
+	def __init__(self):
+		super().__init__()
+		self.setAttribute(Qt.WA_DeleteOnClose)  # let Qt delete stuff before the python garbage-collector gets to work
+		self.settings = QSettings(QSettings.IniFormat, QSettings.UserScope, 'pqgit', 'config')
+		self.pool = None
+
+		# window icon
+		cwd = os.path.dirname(os.path.realpath(__file__))
+		self.setWindowIcon(QIcon(os.path.join(cwd, 'Git-Icon-White.png')))
+		self.setWindowTitle('pqgit')
+
+		# size and position
+		self.move(self.settings.value('w/pos', QPoint(200, 200)))
+		self.resize(self.settings.value('w/size', QSize(1000, 1000)))
+
+		self.tabs = QTabWidget(self)
+		self.tabs.setTabsClosable(True)
+		self.tabs.setMovable(True)
+		self.tabs.setDocumentMode(True)
+		self.tabs.currentChanged.connect(self.on_tab_changed)
+		self.tabs.tabCloseRequested.connect(self.close_tab)
+		self.setCentralWidget(self.tabs)
+
+		# open repo dir (in a new tab), close tab
+		open_shortcut = QShortcut(QKeySequence('Ctrl+O'), self)
+		open_shortcut.activated.connect(self.open_dir)
+		close_shortcut = QShortcut(QKeySequence('Ctrl+W'), self)
+		close_shortcut.activated.connect(lambda: self.close_tab(self.tabs.currentIndex()))
+
+		# panels of the current tab
+		analytics_shortcut = QShortcut(QKeySequence('Ctrl+Shift+A'), self)
+		analytics_shortcut.activated.connect(lambda: self.tabs.count() and self.tabs.currentWidget().show_analytics())
+		pickaxe_shortcut = QShortcut(QKeySequence('Ctrl+F'), self)
+		pickaxe_shortcut.activated.connect(lambda: self.tabs.count() and self.tabs.currentWidget().show_pickaxe())
+
+		timer = QTimer(self)
+		timer.timeout.connect(self.on_timer)
+		timer.start(5000)
+
+		# reopen what was open last time
+		open_repos = self.settings.value('open_repos', [])
+		if isinstance(open_repos, str):
+			open_repos = [open_repos]  # QSettings gives a single value for 1 element lists
+		last_opened = self.settings.value('last_opened_repo', None)
+		if not open_repos and last_opened:
+			open_repos = [last_opened]
+
+		# only the tab shown gets loaded now, the others when they're first shown
+		self.tabs.blockSignals(True)
+		for dir_name in open_repos:
+			try:
+				self.open_tab(dir_name, load=False)
+			except Exception:  #pylint: disable=broad-except
+				pass
+		tabs = self.repo_tabs()
+		if tabs:
+			current = next((tab for tab in tabs if tab.dir_name == last_opened), tabs[0])
+			self.tabs.setCurrentWidget(current)
+		self.tabs.blockSignals(False)
+
+		if tabs:
+			self.on_tab_changed(self.tabs.currentIndex())
+		else:
+			self.open_dir()
+
+	def repo_tabs(self):
+		""" all RepoTabs """
+		return [self.tabs.widget(i) for i in range(self.tabs.count())]
+
+	def open_dir(self):
+		""" show open dir dialog and open repo in a new tab """
+		last_dir = self.settings.value('last_fileopen_dir', '')
+
+		fd = QFileDialog(self, 'Open .git', last_dir)
+		fd.setFileMode(QFileDialog.DirectoryOnly)
+		fd.setFilter(QDir.Filters(QDir.Dirs | QDir.Hidden | QDir.NoDot | QDir.NoDotDot))
+
+		while True:
+			if not fd.exec():
+				return
+			dir_name = fd.selectedFiles()[0]
+			parent = os.path.dirname(dir_name)
+			self.settings.setValue('last_fileopen_dir', parent)
+
+			try:
+				pygit2.Repository(dir_name)
+				break
+			except pygit2.GitError:
+				QMessageBox(self, text='Cannot open repo: ' + dir_name).exec()
+
+		for tab in self.repo_tabs():
+			if tab.dir_name == dir_name:
+				self.tabs.setCurrentWidget(tab)
+				return
+		self.open_tab(dir_name)
+
+	def open_tab(self, dir_name, load=True):
+		""" open a repo in a new tab; show it, unless it's not to be loaded yet """
+		tab = RepoTab(self, dir_name, load)
+		self.tabs.addTab(tab, tab.title())
+		self.tabs.setTabToolTip(self.tabs.indexOf(tab), dir_name)
+		if load:
+			self.tabs.setCurrentWidget(tab)
+		self.save_open_repos()
+
+	def close_tab(self, index):
+		""" close the tab of some repo """
+		if index < 0:
+			return
+		tab = self.tabs.widget(index)
+		tab.close_tab()
+		self.tabs.removeTab(index)
+		tab.deleteLater()
+		self.save_open_repos()
+
+	def save_open_repos(self):
+		""" remember open tabs for the next start """
+		self.settings.setValue('open_repos', [tab.dir_name for tab in self.repo_tabs()])
+
+	def on_tab_changed(self, index):
+		""" only the current tab watches the file system """
+		current = self.tabs.widget(index)
+		for tab in self.repo_tabs():
+			if tab is not current:
+				tab.suspend()
+		if current is None:
+			self.setWindowTitle('pqgit')
+			return
+
+		current.resume()
+		self.setWindowTitle(f'{current.dir_name} - pqgit ({VERSION})')
+		self.settings.setValue('last_opened_repo', current.dir_name)
+		self.enforce_budget()
+
+	def enforce_budget(self):
+		""" evict rows of the least recently used background tabs while all tabs together hold too many """
+		budget = int(self.settings.value('memory_budget_rows', MEMORY_BUDGET))
+		tabs = self.repo_tabs()
+		total = sum(tab.memory_rows() for tab in tabs)
+
+		current = self.tabs.currentWidget()
+		candidates = [t for t in tabs if t is not current and t.loaded and not t.evicted]
+		for tab in sorted(candidates, key=lambda t: t.last_active):
+			if total <= budget:
+				break
+			total -= tab.memory_rows()
+			tab.evict()
+
+	def executor(self):
+		""" process pool for background work of all tabs, started on first use """
+		if self.pool is None:
+			workers = int(self.settings.value('max_workers', min(4, os.cpu_count() or 1)))
+			# spawn: forking a running Qt application is asking for trouble
+			self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+		return self.pool
+
+	def on_timer(self):
+		""" poll difftools of all tabs, keep memory within budget """
+		for tab in self.repo_tabs():
+			tab.on_timer()
+		self.enforce_budget()
+
+	def closeEvent(self, event):  # pylint: disable=invalid-name
 		""" event handler for window closing; save settings """
 		del event
 		self.settings.setValue('w/pos', self.pos())
 		self.settings.setValue('w/size', self.size())
-		self.settings.setValue('w/hist_splitter', self.ui.hist_splitter.sizes())
-		self.settings.setValue('w/cinf_splitter', self.ui.cinf_splitter.sizes())
-		self.settings.setValue('w/diff_splitter', self.ui.diff_splitter.sizes())
 
-		# delete any left temp files
-		self.on_timer()
+		current = self.tabs.currentWidget()
+		if current is not None:
+			self.settings.setValue('w/hist_splitter', current.ui.hist_splitter.sizes())
+			self.settings.setValue('w/cinf_splitter', current.ui.cinf_splitter.sizes())
+			self.settings.setValue('w/diff_splitter', current.ui.diff_splitter.sizes())
+
+		self.save_open_repos()
+		for tab in self.repo_tabs():
+			tab.close_tab()
+
+		if self.pool is not None:
+			self.pool.shutdown(wait=False)
 
 
 def pqgit_main():
 	""" main """
+	multiprocessing.freeze_support()  # the frozen exe (pqgit.spec) is also what starts the workers
 	app = QApplication(sys.argv)
 	app.aboutToQuit.connect(app.deleteLater)
 
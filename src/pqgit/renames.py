@@ -0,0 +1,146 @@
+""" rename and copy detection for tree diffs, done a bit at a time so big diffs don't block the ui
+"""
+import time
+
+import pygit2
+
+from pqgit.model import Patch
+
+SIMILARITY = 50  # minimum similarity (percent) of a renamed or copied file, like git's -M / -C default
+RENAME_LIMIT = 1000  # no inexact detection beyond this many sources x added files (squared), like diff.renameLimit
+TIME_BUDGET = 2.0  # seconds of work for one diff, then only the exact matches are kept
+EMPTY_BLOB = str(pygit2.hash(b''))  # empty files (__init__.py, ...) would all match each other; left out
+
+
+def _signature(data):
+	""" line hash -> number of bytes in such lines """
+	sig = {}
+	for line in data.splitlines(True):
+		key = hash(line)
+		sig[key] = sig.get(key, 0) + len(line)
+	return sig
+
+
+class RenameDetection():
+	"""
+	finds renamed and copied files among the patches of one diff: exact blob matches first, then similar content
+	of deleted (renamed) or modified (copied) files. step() works for a while, take() hands out what was found.
+	Scores are cached by (old blob id, new blob id) in a dict that can be shared between diffs.
+	"""
+	def __init__(self, repo, patches, scores, limit=RENAME_LIMIT, budget=TIME_BUDGET):
+		self.repo = repo
+		self.scores = scores
+		self.limit = limit
+		self.budget = budget
+		self.spent = 0.0
+		self.gave_up = False  # ran out of time; inexact matches dropped
+		self.skipped = False  # too many files for inexact matching
+		self.found = []  # renamed / copied patches, replacing the added ones
+		self.removed = []  # deleted paths that turned out renamed
+		self._sizes = {}  # blob id -> size, None for binary blobs
+		self._sigs = {}  # blob id -> signature
+		self._work = self._detect(patches)
+
+	def step(self, seconds=0.02):
+		""" work for about seconds; True when done (or given up) """
+		start = time.monotonic()
+		for _ in self._work:
+			elapsed = time.monotonic() - start
+			if self.spent + elapsed > self.budget:
+				self.gave_up = True
+				self._work.close()
+				break
+			if elapsed >= seconds:
+				self.spent += elapsed
+				return False
+		self.spent += time.monotonic() - start
+		return True
+
+	def take(self):
+		""" (renamed or copied patches, removed paths) found since the last call """
+		found, removed = self.found, self.removed
+		self.found, self.removed = [], []
+		return found, removed
+
+	def _detect(self, patches):
+		""" generator doing the work, yields after each compared pair """
+		# files only: submodule ids are commits of another repo
+		patches = [p for p in patches if not p.gitlink]
+		deleted = [p for p in patches if p.status == 'D' and p.old_file_id != EMPTY_BLOB]
+		modified = [p for p in patches if p.status == 'M' and p.old_file_id and p.old_file_id != EMPTY_BLOB]
+		added = [p for p in patches if p.status == 'A' and p.new_file_id != EMPTY_BLOB]
+		renamed = set()  # deleted paths already renamed; further matches are copies
+
+		# same blob: a dict lookup each, deleted files preferred over modified ones
+		by_id = {p.old_file_id: p for p in modified}
+		by_id.update((p.old_file_id, p) for p in deleted)
+		rest = []
+		for patch in added:
+			source = by_id.get(patch.new_file_id)
+			if source is None:
+				rest.append(patch)
+			else:
+				self._found(patch, source, 100, renamed)
+		yield
+
+		sources = deleted + modified
+		if not rest or not sources:
+			return
+		if len(rest) * len(sources) > self.limit * self.limit:
+			self.skipped = True
+			return
+
+		# similar content: every pair is scored, then the best ones win; results only count when all are done
+		candidates = []
+		for patch in rest:
+			for source in sources:
+				score = self._score(source.old_file_id, patch.new_file_id)
+				if score >= SIMILARITY:
+					candidates.append((score, patch, source))
+				yield
+
+		candidates.sort(key=lambda c: -c[0])
+		done = set()
+		for score, patch, source in candidates:
+			if patch.path not in done:
+				done.add(patch.path)
+				self._found(patch, source, score, renamed)
+
+	def _found(self, patch, source, score, renamed):
+		""" patch (added) is a rename or copy of source """
+		if source.status == 'D' and source.path not in renamed:
+			renamed.add(source.path)
+			self.removed.append(source.path)
+			status = 'R'
+		else:
+			status = 'C'
+		self.found.append(Patch(patch.path, status, patch.new_file_id, source.old_file_id, source.path, score))
+
+	def _size(self, blob_id):
+		""" size of a blob, None if it's binary """
+		if blob_id not in self._sizes:
+			blob = self.repo[blob_id]
+			self._sizes[blob_id] = None if blob.is_binary else blob.size
+		return self._sizes[blob_id]
+
+	def _sig(self, blob_id):
+		""" signature of a (text) blob """
+		if blob_id not in self._sigs:
+			self._sigs[blob_id] = _signature(self.repo[blob_id].data)
+		return self._sigs[blob_id]
+
+	def _score(self, old_id, new_id):
+		""" similarity in percent: bytes of common lines to the size of the bigger blob """
+		key = (old_id, new_id)
+		if key not in self.scores:
+			old_size, new_size = self._size(old_id), self._size(new_id)
+			if not old_size or not new_size:
+				score = 0  # binary or empty
+			elif min(old_size, new_size) * 100 < SIMILARITY * max(old_size, new_size):
+				score = 0  # sizes too different, no need to read the contents
+			else:
+				new_sig = self._sig(new_id)
+				common = sum(min(size, new_sig.get(line, 0)) for line, size in self._sig(old_id).items())
+				score = common * 100 // max(old_size, new_size)
+			self.scores[key] = score
+		return self.scores[key]
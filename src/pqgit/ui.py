@@ -58,7 +58,13 @@ class Ui_MainWindow(object):
         self.files_groupbox.setObjectName(u"files_groupbox")
         self.verticalLayout_2 = QVBoxLayout(self.files_groupbox)
         self.verticalLayout_2.setObjectName(u"verticalLayout_2")
-        self.tvFiles = QTableView(self.files_groupbox)
+        self.leFilesFilter = QLineEdit(self.files_groupbox)
+        self.leFilesFilter.setObjectName(u"leFilesFilter")
+        self.leFilesFilter.setClearButtonEnabled(True)
+
+        self.verticalLayout_2.addWidget(self.leFilesFilter)
+
+        self.tvFiles = QTreeView(self.files_groupbox)
         self.tvFiles.setObjectName(u"tvFiles")
 
         self.verticalLayout_2.addWidget(self.tvFiles)
@@ -110,6 +116,7 @@ class Ui_MainWindow(object):
         self.branches_groupbox.setTitle(QCoreApplication.translate("MainWindow", u"Branches", None))
         self.history_groupbox.setTitle(QCoreApplication.translate("MainWindow", u"History", None))
         self.files_groupbox.setTitle(QCoreApplication.translate("MainWindow", u"Files", None))
+        self.leFilesFilter.setPlaceholderText(QCoreApplication.translate("MainWindow", u"path prefix", None))
         self.commit_groupbox.setTitle(QCoreApplication.translate("MainWindow", u"Commit", None))
         self.diff_groupbox.setTitle(QCoreApplication.translate("MainWindow", u"Diff", None))
     # retranslateUi
@@ -34,3 +34,50 @@ def parse_tree_rec(tree, include_dirs=False, path=''):
 			if include_dirs:
 				yield (path + obj.name, obj.id.hex)
 			yield from parse_tree_rec(obj, include_dirs, f'{path}{obj.name}/')
+
+
+def tree_changes(repo, old_id, new_id):
+	"""
+	generator over the changed entries of one directory (tree ids, None for a missing side), compared by id and mode;
+	returns [tuple(name, status, old_id, new_id, type_str)], unchanged subtrees are never opened
+	"""
+	old_entries = {e.name: e for e in repo[old_id]} if old_id else {}
+	new_entries = {e.name: e for e in repo[new_id]} if new_id else {}
+
+	for name in old_entries.keys() | new_entries.keys():
+		old, new = old_entries.get(name), new_entries.get(name)
+		if old is not None and new is not None:
+			if old.id == new.id and old.filemode == new.filemode:
+				continue
+			if old.type_str != new.type_str:
+				# file became a directory or the other way around
+				pairs = [(old, None), (None, new)]
+			else:
+				pairs = [(old, new)]
+		else:
+			pairs = [(old, new)]
+
+		for o_e, n_e in pairs:
+			status = 'M' if o_e and n_e else ('A' if n_e else 'D')
+			if o_e and n_e and (o_e.filemode == pygit2.GIT_FILEMODE_LINK) != (n_e.filemode == pygit2.GIT_FILEMODE_LINK):
+				status = 'T'  # file <-> symlink
+			yield (name, status, o_e.id.hex if o_e else None, n_e.id.hex if n_e else None, (o_e or n_e).type_str)
+
+
+def changed_files(repo, old_id, new_id, limit):
+	"""
+	all changed files (and submodules) between two trees: [tuple(path, status, old_id, new_id, type_str)];
+	None as soon as there are more than limit, so a huge diff costs about as much as a small one
+	"""
+	files = []
+	dirs = [('', old_id, new_id)]
+	while dirs:
+		path, o_id, n_id = dirs.pop()
+		for name, status, old, new, type_str in tree_changes(repo, o_id, n_id):
+			if type_str == 'tree':
+				dirs.append((f'{path}{name}/', old, new))
+				continue
+			files.append((path + name, status, old, new, type_str))
+			if len(files) > limit:
+				return None
+	return files
@@ -0,0 +1,231 @@
+""" incremental working directory diff
+"""
+import os
+
+import pygit2
+
+from pqgit.model import Patch
+from pqgit.util import GIT_STATUS, parse_tree_rec
+
+
+# workdir differs from the index
+WT_CHANGED = (
+	pygit2.GIT_STATUS_WT_MODIFIED | pygit2.GIT_STATUS_WT_DELETED | pygit2.GIT_STATUS_WT_TYPECHANGE
+	| pygit2.GIT_STATUS_WT_RENAMED | pygit2.GIT_STATUS_WT_NEW
+)
+
+
+def _stat_key(st):
+	""" what identifies an unchanged file for the stat cache """
+	return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class WorkingDiff():
+	"""
+	keeps the patches of the working directory against some base tree in memory;
+	only paths reported by the file watcher get diffed again
+	"""
+	def __init__(self, repo, base_tree=None):
+		self.repo = repo
+		self.base_tree = base_tree
+		self.base_id = base_tree.id.hex if base_tree is not None else None
+		self.patches = {}  # path -> Patch
+		self.stats = {}  # path -> (mtime, size, inode) when last diffed
+		self.listings = {}  # rel. dir path -> set of known entry names
+
+		self.full_scan()
+
+	def full_scan(self):
+		""" build the complete state once (same as 'git status' would) """
+		self.patches.clear()
+		self.stats.clear()
+		self.listings.clear()
+
+		# diff for working directory only shows... some files; get them anyway, then insert the ones from status
+		diff = self.repo.diff(self.base_tree, None)  # regardless of base_tree being something or None
+		for p in diff:
+			path = p.delta.new_file.path.strip()
+			self.patches[path] = Patch(
+				path,
+				p.delta.status_char(),
+				None,  # p.delta.new_file.id.hex is 'some' id, but it's somehow not ok...
+				p.delta.old_file.id.hex if p.delta.old_file.id.hex.find('00000') < 0 else None,
+			)
+		for path, flags in self.repo.status().items():
+			if path not in self.patches:
+				self.patches[path] = Patch(path.strip(), GIT_STATUS[flags], None, None)
+
+		for path in self.patches:
+			self._remember_stat(path)
+
+	def update(self, abs_paths):
+		"""
+		re-diff the given (absolute) paths, as reported by the file watcher;
+		returns (changed, removed): patches to insert or replace and paths to drop
+		"""
+		changed, removed = [], []
+		seen = set()  # a removed directory is reported with its parent, diff its paths once
+		for abs_path in abs_paths:
+			rel = os.path.relpath(abs_path, self.repo.workdir)
+			if rel == '.':
+				rel = ''
+			if rel.startswith('..') or rel == '.git' or rel.startswith('.git' + os.sep):
+				continue
+			rel = rel.replace(os.sep, '/')
+
+			if rel == '' or os.path.isdir(abs_path):
+				paths = self._dir_changes(rel, abs_path)
+			elif not os.path.exists(abs_path):
+				# a watched directory that was removed is reported with its own path, too
+				paths = self._paths_below(rel) or [rel]
+				for gone in [d for d in self.listings if d == rel or d.startswith(rel + '/')]:
+					del self.listings[gone]
+			else:
+				paths = [rel]
+
+			for path in paths:
+				if path in seen:
+					continue
+				seen.add(path)
+				patch = self._diff_path(path)
+				if patch is False:
+					continue  # stat cache says: nothing new
+				if patch is None:
+					if self.patches.pop(path, None) is not None:
+						removed.append(path)
+				else:
+					self.patches[path] = patch
+					changed.append(patch)
+
+		return changed, removed
+
+	def _dir_changes(self, rel_dir, abs_dir):
+		""" paths added to or removed from a directory since it was last seen """
+		try:
+			names = {e.name for e in os.scandir(abs_dir)}
+		except OSError:
+			names = set()
+		if not rel_dir:
+			names.discard('.git')
+
+		known = self.listings.get(rel_dir)
+		if known is None:
+			known = self._known_names(rel_dir)
+		self.listings[rel_dir] = names
+
+		prefix = rel_dir + '/' if rel_dir else ''
+		paths = []
+		for name in names ^ known:
+			path = prefix + name
+			if os.path.isdir(abs_dir + os.sep + name):
+				# new directory: everything inside is new as well
+				for root, _dirs, files in os.walk(abs_dir + os.sep + name):
+					rel_root = os.path.relpath(root, self.repo.workdir).replace(os.sep, '/')
+					paths += [rel_root + '/' + f for f in files]
+			else:
+				paths += self._paths_below(path) or [path]
+		return paths
+
+	def _known_names(self, rel_dir):
+		""" entry names git already knows about in a directory (base tree and current patches) """
+		names = set()
+		tree = self._subtree(rel_dir)
+		if tree is not None:
+			names.update(o.name for o in tree)
+
+		# patches are few compared to the tree; no need for an index here
+		prefix = rel_dir + '/' if rel_dir else ''
+		for path in self.patches:
+			if path.startswith(prefix):
+				names.add(path[len(prefix):].split('/', 1)[0])
+		return names
+
+	def _subtree(self, rel_dir):
+		""" base tree of some directory, if it has one """
+		if self.base_tree is None or not rel_dir:
+			return self.base_tree
+		try:
+			obj = self.repo[self.base_tree[rel_dir].id]
+		except KeyError:
+			return None
+		return obj if obj.type_str == 'tree' else None
+
+	def _paths_below(self, rel_dir):
+		""" known file paths inside a (removed) directory """
+		paths = set()
+		tree = self._subtree(rel_dir)
+		if tree is not None and rel_dir:
+			paths.update(rel_dir + '/' + o[0] for o in parse_tree_rec(tree))
+		paths.update(p for p in self.patches if p.startswith(rel_dir + '/'))
+		return list(paths)
+
+	def _remember_stat(self, path):
+		""" store the stat key of a file, or forget it if it's gone """
+		try:
+			self.stats[path] = _stat_key(os.lstat(self.repo.workdir + path))
+		except OSError:
+			self.stats.pop(path, None)
+
+	def _diff_path(self, path):
+		""" Patch for one path, None if it's clean (or gone), False if unchanged since last time """
+		abs_path = self.repo.workdir + path
+		try:
+			key = _stat_key(os.lstat(abs_path))
+		except OSError:
+			key = None
+
+		if key is not None and self.stats.get(path) == key:
+			return False
+
+		if key is None:
+			self.stats.pop(path, None)
+		else:
+			self.stats[path] = key
+
+		old_id = None
+		if self.base_tree is not None:
+			try:
+				entry = self.base_tree[path]
+			except KeyError:
+				entry = None
+			if entry is not None and entry.type_str == 'blob':
+				old_id = entry.id.hex
+
+		if old_id is not None:
+			if key is None:
+				return Patch(path, 'D', None, old_id)
+			if self._has_id(path, old_id):
+				return None
+			return Patch(path, 'M', None, old_id)
+
+		if key is None:
+			return None
+
+		try:
+			flags = self.repo.status_file(path)
+		except (KeyError, pygit2.GitError):
+			return None
+		status = GIT_STATUS.get(flags)
+		if flags == pygit2.GIT_STATUS_CURRENT or status in (None, 'I'):
+			return None
+		return Patch(path, status, None, None)
+
+	def _has_id(self, path, old_id):
+		"""
+		whether the file's content is blob old_id, as git sees it (after autocrlf, eol, ... filters, which
+		hashing the raw file would skip): status compares the file to the index entry with filters applied
+		"""
+		try:
+			flags = self.repo.status_file(path)
+		except (KeyError, pygit2.GitError):
+			return False
+		if flags & WT_CHANGED:
+			# staged, then changed back to old_id: rare, shown as modified until the next full scan
+			return False
+
+		index = self.repo.index
+		index.read(False)
+		try:
+			return index[path].id.hex == old_id
+		except KeyError:
+			return False
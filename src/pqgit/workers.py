@@ -0,0 +1,123 @@
+""" functions run in the worker processes (see Pqgit.executor)
+
+No Qt in here: spawned workers import this module (and the package), not the gui.
+"""
+import re
+from collections import OrderedDict
+
+import pygit2
+
+# worker process state, kept between tasks of the same search; searches of several tabs can run at once
+MAX_STATES = 4
+_STATES = OrderedDict()  # (repo path, search key) -> {repo, counts, pairs}, least recently used first
+_REPOS = {}  # path -> open Repository, for the path scans
+
+
+def _blob_count(repo, state, oid, needle):
+	""" occurrences of needle in a blob, cached by blob id """
+	if oid.raw == b'\0' * len(oid.raw):
+		return 0
+	counts = state['counts']
+	if oid not in counts:
+		blob = repo[oid]
+		counts[oid] = 0 if blob.is_binary else blob.data.count(needle)
+	return counts[oid]
+
+
+def _pair_matches(repo, state, old_id, new_id, pattern):
+	""" whether an added or removed line of the blob pair matches pattern, cached by blob ids """
+	pairs = state['pairs']
+	key = (old_id, new_id)
+	if key not in pairs:
+		zero = b'\0' * len(old_id.raw)
+		old = repo[old_id] if old_id.raw != zero else None
+		new = repo[new_id] if new_id.raw != zero else None
+		if (old is not None and old.is_binary) or (new is not None and new.is_binary):
+			pairs[key] = False
+		else:
+			# direction doesn't matter, both + and - lines count
+			patch = old.diff(new) if old is not None and new is not None else (old or new).diff()
+			pairs[key] = any(
+				line.origin in '+-' and pattern.search(line.content)
+				for hunk in patch.hunks
+				for line in hunk.lines
+			)
+	return pairs[key]
+
+
+def _search_state(repo_path, search_key):
+	""" blob caches of one search, kept for the few most recently used searches """
+	key = (repo_path, search_key)
+	state = _STATES.get(key)
+	if state is None:
+		state = _STATES[key] = {'repo': pygit2.Repository(repo_path), 'counts': {}, 'pairs': {}}
+		while len(_STATES) > MAX_STATES:
+			_STATES.popitem(last=False)
+	_STATES.move_to_end(key)
+	return state
+
+
+def search_chunk(repo_path, search_key, needle, regex, commit_ids):
+	"""
+	pickaxe: diff each commit to its parent (merges are skipped, like git log -S / -G do);
+	returns the number of commits searched and [(commit id, [paths])] for the ones that add or remove needle
+	"""
+	state = _search_state(repo_path, search_key)
+	repo = state['repo']
+	pattern = re.compile(needle) if regex else None
+	needle_bytes = needle.encode('utf-8')
+
+	matches = []
+	for c_id in commit_ids:
+		commit = repo[c_id]
+		if len(commit.parents) > 1:
+			continue
+		if commit.parents:
+			diff = commit.parents[0].tree.diff_to_tree(commit.tree)
+		else:
+			diff = commit.tree.diff_to_tree(swap=True)
+
+		paths = []
+		for delta in diff.deltas:
+			if pygit2.GIT_FILEMODE_COMMIT in (delta.old_file.mode, delta.new_file.mode):
+				continue  # submodule; the ids are commits of another repo
+			old_id, new_id = delta.old_file.id, delta.new_file.id
+			if regex:
+				found = _pair_matches(repo, state, old_id, new_id, pattern)
+			else:
+				old_count = _blob_count(repo, state, old_id, needle_bytes)
+				found = old_count != _blob_count(repo, state, new_id, needle_bytes)
+			if found:
+				paths.append(delta.new_file.path)
+		if paths:
+			matches.append((c_id, paths))
+
+	return len(commit_ids), matches
+
+
+def _entry_id(tree, path):
+	""" id of the tree entry at path, None if there is none """
+	try:
+		return tree[path].id
+	except KeyError:
+		return None
+
+
+def path_mask_chunk(repo_path, path, commit_ids):
+	"""
+	analytics: for each commit, whether it changed the file or directory at path (compared to all of its parents);
+	a whole path, unlike the prefix of the files filter: "src/pq" does not match "src/pqgit"
+	"""
+	repo = _REPOS.get(repo_path)
+	if repo is None:
+		repo = _REPOS[repo_path] = pygit2.Repository(repo_path)
+
+	mask = []
+	for c_id in commit_ids:
+		commit = repo[c_id]
+		entry_id = _entry_id(commit.tree, path)
+		if commit.parents:
+			mask.append(all(_entry_id(p.tree, path) != entry_id for p in commit.parents))
+		else:
+			mask.append(entry_id is not None)
+	return mask